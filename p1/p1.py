@@ -5,9 +5,51 @@
 from p1_support import load_level, show_level, save_level_costs
 from math import inf, sqrt
 from heapq import heappop, heappush
+from array import array
+from timeit import default_timer as time
 
 
-def dijkstras_shortest_path(initial_position, destination, graph, adj):
+SEARCH_MODES = ('dijkstra', 'astar', 'bidirectional', 'dial')
+
+
+def cheapest_space(graph):
+    """ Finds the cost of the cheapest space in a loaded or compiled level, which no edge can cost less than. """
+    return min(graph['spaces'].values(), default=0) if 'spaces' in graph else graph['scale']
+
+
+def octile_heuristic(graph):
+    """ Builds an admissible octile-distance heuristic for a loaded level.
+
+    Args:
+        graph: A loaded level, containing walls, spaces, and waypoints, or a level compiled by compile_level.
+
+    Returns:
+        A function estimating the cost of the cheapest path between two cells. Every straight step costs at least the
+        cheapest space in the level and every diagonal step sqrt(2) times that, so the estimate never overshoots.
+    """
+    scale = cheapest_space(graph)
+    cells = graph.get('cells')  # compiled levels name cells by their node number
+    diagonal = sqrt(2) - 1
+
+    def h(a, b):
+        if cells:
+            a, b = cells[a], cells[b]
+        dx, dy = abs(a[0] - b[0]), abs(a[1] - b[1])
+        return scale * (max(dx, dy) + diagonal * min(dx, dy))
+    return h
+
+
+def backpath(visited, cell):
+    """ Follows (dist, prev) entries back from cell and returns the cells in order from the search origin. """
+    path = []
+    while cell is not None:
+        path.append(cell)
+        cell = visited[cell][1]
+    path.reverse()
+    return path
+
+
+def dijkstras_shortest_path(initial_position, destination, graph, adj, mode='dijkstra', heuristic=None, stats=None):
     """ Searches for a minimal cost path through a graph using Dijkstra's algorithm.
 
     Args:
@@ -15,57 +57,335 @@ def dijkstras_shortest_path(initial_position, destination, graph, adj):
         destination: The end location for the path.
         graph: A loaded level, containing walls, spaces, and waypoints.
         adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+        mode: 'dijkstra', 'astar' to guide the search with a heuristic, 'bidirectional' to run A* from both ends
+            at once (which relies on edge costs being the same in both directions, as they are in navigation_edges),
+            or 'dial' to run Dijkstra's algorithm over a bucket queue (see dials_sweep).
+        heuristic: A function estimating the cost between two cells, used by the A* modes. Defaults to the octile
+            distance over graph.
+        stats: An optional dictionary which receives the number of nodes the search expanded under 'expanded'.
 
     Returns:
         If a path exits, return a list containing all cells from initial_position to destination.
         Otherwise, return None.
 
     """
-    q = [(0, initial_position)]  # node queue
+    assert mode in SEARCH_MODES, 'Error: unknown search mode.'
+    if mode in ('astar', 'bidirectional') and heuristic is None:
+        heuristic = octile_heuristic(graph)
+    if mode == 'bidirectional':
+        return bidirectional_search(initial_position, destination, graph, adj, heuristic, stats)
+    if mode == 'dial':
+        _, prev = dials_sweep(initial_position, graph, adj, destination, stats)
+        return reconstruct_path(prev, destination)
+
+    def h(cell):
+        return heuristic(cell, destination) if mode == 'astar' else 0
+
+    q = [(h(initial_position), 0, initial_position)]  # node queue
     visited = {initial_position: (0, None)}  # dist, prev
+    expanded = 0
+    path = None
 
     # while queue not empty
     while q:
-        cur_dist, cur = heappop(q)  # get current
+        _, cur_dist, cur = heappop(q)  # get current
+        if cur_dist > visited[cur][0]:  # skip stale queue entries
+            continue
         if cur == destination:  # check success
-            path = [cur]
-            back = visited[cur][1]
-            while back and back is not initial_position:  # backpathing
-                path = [back] + path
-                back = visited[back][1]
-            return [initial_position] + path
+            path = backpath(visited, cur)
+            break
+        expanded += 1
+        for pos, cost in adj(graph, cur):  # for each neighbour
+            if cost is not inf:
+                pathcost = cost + cur_dist
+                if pos not in visited or pathcost < visited[pos][0]:
+                    visited[pos] = (pathcost, cur)
+                    heappush(q, (pathcost + h(pos), pathcost, pos))
+
+    if stats is not None:
+        stats['expanded'] = expanded
+    return path
+
+
+def bidirectional_search(initial_position, destination, graph, adj, heuristic, stats=None):
+    """ Searches for a minimal cost path by running A* forwards from initial_position and backwards from destination.
+
+    Both searches use the average of the two heuristics as their potential, which keeps them consistent with each
+    other, so the search can stop as soon as the two smallest queue keys add up to the best meeting cost.
+
+    Args:
+        initial_position: The initial cell from which the path extends.
+        destination: The end location for the path.
+        graph: A loaded level, containing walls, spaces, and waypoints.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+        heuristic: A function estimating the cost between two cells.
+        stats: An optional dictionary which receives the number of nodes the search expanded under 'expanded'.
+
+    Returns:
+        If a path exits, return a list containing all cells from initial_position to destination.
+        Otherwise, return None.
+
+    """
+    def potential(cell):
+        return 0.5 * (heuristic(cell, destination) - heuristic(cell, initial_position))
+
+    forward = ([(potential(initial_position), 0, initial_position)], {initial_position: (0, None)}, 1)
+    backward = ([(-potential(destination), 0, destination)], {destination: (0, None)}, -1)
+    best, meet = (0, initial_position) if initial_position == destination else (inf, None)
+    expanded = 0
+
+    while forward[0] and backward[0] and forward[0][0][0] + backward[0][0][0] < best:
+        # advance whichever side has the smaller key
+        (q, visited, sign), other = (forward, backward) if forward[0][0][0] <= backward[0][0][0] else (backward, forward)
+        _, cur_dist, cur = heappop(q)
+        if cur_dist > visited[cur][0]:  # skip stale queue entries
+            continue
+        expanded += 1
         for pos, cost in adj(graph, cur):  # for each neighbour
             if cost is not inf:
                 pathcost = cost + cur_dist
-                if not visited.get(pos) or pathcost < visited[pos][0]:
+                if pos not in visited or pathcost < visited[pos][0]:
                     visited[pos] = (pathcost, cur)
+                    heappush(q, (pathcost + sign * potential(pos), pathcost, pos))
+                    if pos in other[1] and pathcost + other[1][pos][0] < best:  # the searches met
+                        best, meet = pathcost + other[1][pos][0], pos
+
+    if stats is not None:
+        stats['expanded'] = expanded
+    if meet is None:
+        return None
+    return backpath(forward[1], meet) + backpath(backward[1], meet)[-2::-1]
+
+
+DIRECTIONS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+def jump_point_search(initial_position, destination, graph, stats=None):
+    """ Searches for a minimal cost path through a level using Jump Point Search.
+
+    Cells whose 8 neighbours are all spaces of their own cost are interior to a uniform region, where every
+    symmetric path costs the same, so the search jumps straight over them in a single direction. Any other cell
+    (next to a wall or to a different cost) stops the jump and is expanded in all 8 directions, like plain Dijkstra.
+    Edge costs follow navigation_edges, so the path found costs exactly as much as dijkstras_shortest_path's.
+
+    Args:
+        initial_position: The initial cell from which the path extends.
+        destination: The end location for the path.
+        graph: A loaded level, containing walls, spaces, and waypoints.
+        stats: An optional dictionary which receives the number of jump points the search expanded under 'expanded'.
+
+    Returns:
+        If a path exits, return a list containing all cells from initial_position to destination.
+        Otherwise, return None.
+
+    """
+    spaces = graph['spaces']
+    h = octile_heuristic(graph)
+    uniform = {}
+
+    def is_uniform(cell):
+        if cell not in uniform:
+            cost = spaces[cell]
+            uniform[cell] = all(spaces.get((cell[0] + dx, cell[1] + dy)) == cost for dx, dy in DIRECTIONS)
+        return uniform[cell]
+
+    def step(cell, direction, cur_dist):
+        nxt = (cell[0] + direction[0], cell[1] + direction[1])
+        if nxt not in spaces:
+            return None, inf
+        if direction[0] and direction[1]:
+            cost = sqrt(2) * 0.5 * (spaces[nxt] + spaces[cell])
+        else:
+            cost = 0.5 * (spaces[nxt] + spaces[cell])
+        return nxt, cost + cur_dist
+
+    def jump(cell, direction, cur_dist):
+        # walk in one direction until reaching the destination or a cell which needs expanding
+        while True:
+            cell, cur_dist = step(cell, direction, cur_dist)
+            if cell is None:
+                return None, inf
+            if cell == destination or not is_uniform(cell):
+                return cell, cur_dist
+            if direction[0] and direction[1]:  # diagonal jumps stop where a straight jump would find something
+                if jump(cell, (direction[0], 0), cur_dist)[0] or jump(cell, (0, direction[1]), cur_dist)[0]:
+                    return cell, cur_dist
+
+    q = [(h(initial_position, destination), 0, initial_position)]  # node queue
+    visited = {initial_position: (0, None, None)}  # dist, prev, direction
+    expanded = 0
+    path = None
+
+    while q:
+        _, cur_dist, cur = heappop(q)
+        if cur_dist > visited[cur][0]:  # skip stale queue entries
+            continue
+        if cur == destination:  # check success
+            path = [cur]
+            while visited[cur][1] is not None:  # backpathing, filling in the cells jumped over
+                prev, (dx, dy) = visited[cur][1], visited[cur][2]
+                while cur != prev:
+                    cur = (cur[0] - dx, cur[1] - dy)
+                    path.append(cur)
+            path.reverse()
+            break
+        expanded += 1
+
+        direction = visited[cur][2]
+        if direction is None or not is_uniform(cur):
+            directions = DIRECTIONS
+        elif direction[0] and direction[1]:
+            directions = [direction, (direction[0], 0), (0, direction[1])]
+        else:
+            directions = [direction]
+
+        for d in directions:
+            pos, pathcost = jump(cur, d, cur_dist)
+            if pos is not None and (pos not in visited or pathcost < visited[pos][0]):
+                visited[pos] = (pathcost, cur, d)
+                heappush(q, (pathcost + h(pos, destination), pathcost, pos))
+
+    if stats is not None:
+        stats['expanded'] = expanded
+    return path
+
+
+def dijkstras_sweep(initial_position, graph, adj):
+    """ Settles every reachable cell from initial_position in a single pass of Dijkstra's algorithm.
+
+    Args:
+        initial_position: The initial cell from which the paths extend.
+        graph: A loaded level, containing walls, spaces, and waypoints.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+
+    Returns:
+        A pair of dictionaries: the first maps each reachable cell to the cost of its shortest path from
+        initial_position, the second maps each reachable cell to its predecessor on that path (None for
+        initial_position).
+    """
+    return multi_source_sweep([initial_position], graph, adj)
+
+
+def multi_source_sweep(sources, graph, adj):
+    """ Settles every reachable cell from the nearest of several sources in a single pass of Dijkstra's algorithm.
+
+    Args:
+        sources: The cells from which the paths extend.
+        graph: A loaded level, containing walls, spaces, and waypoints.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+
+    Returns:
+        A pair of dictionaries: the first maps each reachable cell to the cost of its shortest path from the nearest
+        source, the second maps each reachable cell to its predecessor on that path (None for the sources).
+    """
+    dist = {source: 0 for source in sources}
+    prev = {source: None for source in sources}
+    settled = set()
+    q = sorted((0, source) for source in dist)  # node queue
+
+    while q:
+        cur_dist, cur = heappop(q)
+        if cur in settled:  # skip stale queue entries
+            continue
+        settled.add(cur)
+        for pos, cost in adj(graph, cur):  # for each neighbour
+            if cost is not inf:
+                pathcost = cost + cur_dist
+                if pos not in dist or pathcost < dist[pos]:
+                    dist[pos] = pathcost
+                    prev[pos] = cur
                     heappush(q, (pathcost, pos))
-    return None
+    return dist, prev
+
+
+def dials_sweep(initial_position, graph, adj, destination=None, stats=None):
+    """ Runs Dijkstra's algorithm from initial_position over a bucket queue instead of a heap.
 
+    Bucket k holds the cells whose cost so far lies in [k * width, (k + 1) * width), where width is the cost of the
+    cheapest space. No edge is cheaper than that, so no cell in a bucket can improve another cell in the same bucket,
+    and each bucket can be settled in any order while the distances stay exact floats (diagonal sqrt(2) edges are
+    never rounded).
+
+    Args:
+        initial_position: The initial cell from which the paths extend.
+        graph: A loaded level, containing walls, spaces, and waypoints.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+        destination: If given, the sweep stops as soon as this cell is settled.
+        stats: An optional dictionary which receives the number of nodes the sweep expanded under 'expanded'.
 
-def dijkstras_shortest_path_to_all(initial_position, graph, adj):
+    Returns:
+        A pair of dictionaries, the distance map and the predecessor map, as returned by dijkstras_sweep.
+    """
+    width = cheapest_space(graph)
+    assert width > 0, 'Error: bucket queue needs every space to cost more than 0.'
+
+    dist = {initial_position: 0}
+    prev = {initial_position: None}
+    settled = set()
+    buckets = {0: [initial_position]}  # bucket number -> cells queued in it
+    current = 0
+    expanded = 0
+
+    while buckets:
+        while current not in buckets:  # skip ahead to the next non-empty bucket
+            current += 1
+        for cur in buckets.pop(current):
+            if cur in settled:  # skip stale queue entries
+                continue
+            settled.add(cur)
+            if cur == destination:
+                buckets = None
+                break
+            expanded += 1
+            cur_dist = dist[cur]
+            for pos, cost in adj(graph, cur):  # for each neighbour
+                if cost is not inf and pos not in settled:
+                    pathcost = cost + cur_dist
+                    if pos not in dist or pathcost < dist[pos]:
+                        dist[pos] = pathcost
+                        prev[pos] = cur
+                        buckets.setdefault(int(pathcost / width), []).append(pos)
+
+    if stats is not None:
+        stats['expanded'] = expanded
+    return dist, prev
+
+
+def reconstruct_path(prev, destination):
+    """ Rebuilds the path to destination from a predecessor map produced by dijkstras_sweep.
+
+    Args:
+        prev: A dictionary mapping cells to their predecessor on a shortest path.
+        destination: The end location for the path.
+
+    Returns:
+        A list containing all cells from the sweep's origin to destination, or None if destination was not reached.
+    """
+    if destination not in prev:
+        return None
+    path = []
+    back = destination
+    while back is not None:  # backpathing
+        path.append(back)
+        back = prev[back]
+    path.reverse()
+    return path
+
+
+def dijkstras_shortest_path_to_all(initial_position, graph, adj, mode='dijkstra'):
     """ Calculates the minimum cost to every reachable cell in a graph from the initial_position.
 
     Args:
         initial_position: The initial cell from which the path extends.
         graph: A loaded level, containing walls, spaces, and waypoints.
         adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+        mode: 'dijkstra' to use a heap, or 'dial' to use a bucket queue.
 
     Returns:
         A dictionary, mapping destination cells to the cost of a path from the initial_position.
     """
-    level = {**graph["spaces"],**{pos:1.0 for pos in graph["waypoints"].values()}} # recomprehend graph
-    level_cost = {}
-    for pos in level: # for every reachable space
-        p = dijkstras_shortest_path(initial_position, pos, graph, adj) # find path
-        cost = 0 if p else inf
-        if p:
-            for i in range(len(p)-1):
-                a = p[i]
-                b = p[i+1]
-                cost = cost + (level[a] + level[b]) / 2 * (1 if abs(a[0]-b[0]) + abs(a[1]-b[1]) > 1 else sqrt(2)) #calc path cost
-        level_cost[pos] = cost
-    return level_cost
+    dist, _ = (dials_sweep if mode == 'dial' else dijkstras_sweep)(initial_position, graph, adj)
+    return dist
 
 
 def navigation_edges(level, cell):
@@ -108,13 +428,63 @@ def navigation_edges(level, cell):
     return neighbors
 
 
-def test_route(filename, src_waypoint, dst_waypoint):
+def compile_level(level, adj=navigation_edges):
+    """ Compiles a loaded level into a compressed-sparse-row graph, so searches can skip recomputing its edges.
+
+    Every space becomes a node numbered by its position in the sorted list of spaces. The neighbours of node n are
+    neighbours[offsets[n]:offsets[n + 1]], joined to it by the edges of the same slice of weights.
+
+    Args:
+        level: A loaded level, containing walls, spaces, and waypoints.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+
+    Returns:
+        The compiled level (dict), containing the offsets, neighbours and weights arrays, the cell of every node, a
+        mapping of cells to nodes, and the cost of the cheapest space (for octile_heuristic).
+    """
+    cells = sorted(level['spaces'])
+    index = {cell: node for node, cell in enumerate(cells)}
+    offsets = array('q', [0])
+    neighbours = array('q')
+    weights = array('d')
+
+    for cell in cells:
+        for pos, cost in adj(level, cell):
+            if cost is not inf:
+                neighbours.append(index[pos])
+                weights.append(cost)
+        offsets.append(len(neighbours))
+
+    return {'offsets': offsets,
+            'neighbours': neighbours,
+            'weights': weights,
+            'cells': cells,
+            'index': index,
+            'scale': min(level['spaces'].values(), default=0)}
+
+
+def compiled_edges(graph, node):
+    """ Provides the adjacent nodes of a node in a compiled level and their respective edge costs.
+
+    Args:
+        graph: A level compiled by compile_level.
+        node: The number of a target node.
+
+    Returns:
+        An iterable of (adjacent node, edge cost) pairs.
+    """
+    start, end = graph['offsets'][node], graph['offsets'][node + 1]
+    return zip(graph['neighbours'][start:end], graph['weights'][start:end])
+
+
+def test_route(filename, src_waypoint, dst_waypoint, mode='astar'):
     """ Loads a level, searches for a path between the given waypoints, and displays the result.
 
     Args:
         filename: The name of the text file containing the level.
         src_waypoint: The character associated with the initial waypoint.
         dst_waypoint: The character associated with the destination waypoint.
+        mode: The search mode passed on to dijkstras_shortest_path, or 'jps' to use jump_point_search.
 
     """
 
@@ -127,14 +497,19 @@ def test_route(filename, src_waypoint, dst_waypoint):
     dst = level['waypoints'][dst_waypoint]
 
     # Search for and display the path from src to dst.
-    path = dijkstras_shortest_path(src, dst, level, navigation_edges)
+    stats = {}
+    if mode == 'jps':
+        path = jump_point_search(src, dst, level, stats=stats)
+    else:
+        path = dijkstras_shortest_path(src, dst, level, navigation_edges, mode, stats=stats)
     if path:
         show_level(level, path)
     else:
         print("No path possible!")
+    print("Expanded %d nodes." % stats['expanded'])
 
 
-def cost_to_all_cells(filename, src_waypoint, output_filename):
+def cost_to_all_cells(filename, src_waypoint, output_filename, mode='dijkstra'):
     """ Loads a level, calculates the cost to all reachable cells from 
     src_waypoint, then saves the result in a csv file with name output_filename.
 
@@ -142,6 +517,7 @@ def cost_to_all_cells(filename, src_waypoint, output_filename):
         filename: The name of the text file containing the level.
         src_waypoint: The character associated with the initial waypoint.
         output_filename: The filename for the output csv file.
+        mode: The queue passed on to dijkstras_shortest_path_to_all.
 
     """
 
@@ -154,10 +530,36 @@ def cost_to_all_cells(filename, src_waypoint, output_filename):
 
     # Calculate the cost to all reachable cells from src and save to a csv file.
     costs_to_all_cells = dijkstras_shortest_path_to_all(
-        src, level, navigation_edges)
+        src, level, navigation_edges, mode)
     save_level_costs(level, costs_to_all_cells, output_filename)
 
 
+def compare_queues(filename, src_waypoint, runs=3):
+    """ Times full sweeps of a compiled level with the heap and with the bucket queue and prints the results.
+
+    Args:
+        filename: The name of the text file containing the level.
+        src_waypoint: The character associated with the initial waypoint.
+        runs: The number of sweeps to time with each queue; the fastest is reported.
+
+    """
+    level = load_level(filename)
+    graph = compile_level(level)  # so the timings are not swamped by navigation_edges
+    src = graph['index'][level['waypoints'][src_waypoint]]
+
+    results = {}
+    for mode in ('dijkstra', 'dial'):
+        best = inf
+        for _ in range(runs):
+            start = time()
+            results[mode] = dijkstras_shortest_path_to_all(src, graph, compiled_edges, mode)
+            best = min(best, time() - start)
+        print("%s: %.3fs" % (mode, best))
+
+    worst = max(abs(results['dijkstra'][cell] - cost) for cell, cost in results['dial'].items())
+    print("Largest difference between the two distance maps:", worst)
+
+
 if __name__ == '__main__':
     filename, src_waypoint, dst_waypoint = 'example.txt', 'a', 'e'
 
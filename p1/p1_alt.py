@@ -0,0 +1,122 @@
+# ALT (A*, landmarks and the triangle inequality) heuristics for P1
+
+from array import array
+from math import inf
+
+from p1 import dijkstras_shortest_path, dijkstras_sweep, multi_source_sweep, navigation_edges, octile_heuristic
+from p1_support import cached_level_data, level_hash, load_level
+
+
+def select_landmarks(level, count, adj=navigation_edges, use_waypoints=False):
+    """ Picks landmark cells spread as far apart as possible.
+
+    Each new landmark is the reachable cell farthest from every landmark picked so far, starting from the level's
+    waypoints if use_waypoints is set, or from the cell farthest from an arbitrary space otherwise.
+
+    Args:
+        level: A loaded level, containing walls, spaces, and waypoints.
+        count: The number of landmarks to pick.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+        use_waypoints: Whether to use the level's waypoints as the first landmarks.
+
+    Returns:
+        A list of landmark cells.
+    """
+    if use_waypoints:
+        landmarks = [level['waypoints'][name] for name in sorted(level['waypoints'])][:count]
+    else:
+        dist, _ = dijkstras_sweep(min(level['spaces']), level, adj)
+        landmarks = [max(dist, key=dist.get)]
+
+    while len(landmarks) < count:
+        dist, _ = multi_source_sweep(landmarks, level, adj)
+        farthest = max(dist, key=dist.get)
+        if farthest in landmarks:  # every reachable cell is already a landmark
+            break
+        landmarks.append(farthest)
+
+    return landmarks
+
+
+def build_landmarks(level, count=8, adj=navigation_edges, use_waypoints=False):
+    """ Picks landmarks for a level and runs one full sweep from each.
+
+    Args:
+        level: A loaded level, containing walls, spaces, and waypoints.
+        count: The number of landmarks to pick.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+        use_waypoints: Whether to use the level's waypoints as the first landmarks.
+
+    Returns:
+        The landmark table (dict), containing the landmark cells and, for each, an array of the cost from it to every
+        cell of the level's bounding box (inf where unreachable), stored row by row from origin.
+    """
+    xs, ys = zip(*(list(level['spaces'].keys()) + list(level['walls'])))
+    origin, width, height = (min(xs), min(ys)), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1
+    landmarks = select_landmarks(level, count, adj, use_waypoints)
+
+    distances = []
+    for landmark in landmarks:
+        dist, _ = dijkstras_sweep(landmark, level, adj)
+        costs = array('d', [inf]) * (width * height)
+        for (x, y), cost in dist.items():
+            costs[(y - origin[1]) * width + x - origin[0]] = cost
+        distances.append(costs)
+
+    return {'landmarks': landmarks, 'origin': origin, 'width': width, 'distances': distances}
+
+
+def load_landmarks(filename, count=8, use_waypoints=False):
+    """ Loads the landmark table of a level file, building and caching it first if needed.
+
+    The table is cached next to the level as filename + '.alt.pickle' (see cached_level_data), and rebuilt for other
+    landmark settings.
+
+    Args:
+        filename: The name of the text file containing the level.
+        count: The number of landmarks to pick.
+        use_waypoints: Whether to use the level's waypoints as the first landmarks.
+
+    Returns:
+        The landmark table (dict) as built by build_landmarks.
+    """
+    return cached_level_data(filename, '.alt.pickle', [level_hash(filename), count, use_waypoints],
+                             lambda level: build_landmarks(level, count, use_waypoints=use_waypoints))
+
+
+def alt_heuristic(table, level):
+    """ Builds a landmark heuristic for dijkstras_shortest_path's A* modes.
+
+    By the triangle inequality, the cost between two cells is at least the difference in their costs from any one
+    landmark. The estimate is the largest such difference, or the octile distance if that is larger.
+
+    Args:
+        table: A landmark table, as returned by build_landmarks or load_landmarks.
+        level: The loaded level the table was built for.
+
+    Returns:
+        A function estimating the cost of the cheapest path between two cells.
+    """
+    octile = octile_heuristic(level)
+    origin, width, distances = table['origin'], table['width'], table['distances']
+
+    def h(a, b):
+        i = (a[1] - origin[1]) * width + a[0] - origin[0]
+        j = (b[1] - origin[1]) * width + b[0] - origin[0]
+        best = octile(a, b)
+        for costs in distances:
+            if costs[i] != inf and costs[j] != inf:
+                best = max(best, abs(costs[i] - costs[j]))
+        return best
+    return h
+
+
+if __name__ == '__main__':
+    filename, src_waypoint, dst_waypoint = 'test_maze.txt', 'a', 'd'
+    level = load_level(filename)
+    src, dst = level['waypoints'][src_waypoint], level['waypoints'][dst_waypoint]
+
+    for name, heuristic in (('octile', None), ('ALT', alt_heuristic(load_landmarks(filename), level))):
+        stats = {}
+        dijkstras_shortest_path(src, dst, level, navigation_edges, 'astar', heuristic, stats)
+        print("%s: expanded %d nodes." % (name, stats['expanded']))
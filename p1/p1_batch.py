@@ -0,0 +1,72 @@
+# Parallel batch route queries for P1
+
+import random
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+from timeit import default_timer as time
+
+import numpy
+
+from p1_grid import make_grid, stream_level_array, dijkstras_shortest_path_array
+
+# the level each worker process searches, attached to shared memory by init_worker
+worker_grid = None
+worker_memory = None
+
+
+def init_worker(name, shape, waypoints):
+    """ Attaches a worker process to the shared copy of the level made by batch_routes. """
+    global worker_grid, worker_memory
+    worker_memory = SharedMemory(name=name)
+    costs = numpy.ndarray(shape, dtype=numpy.float32, buffer=worker_memory.buf)
+    walls = numpy.ndarray(shape, dtype=numpy.bool_, buffer=worker_memory.buf, offset=costs.nbytes)
+    worker_grid = make_grid(costs, waypoints, walls)
+
+
+def run_query(query):
+    """ Answers a single (src, dst) query against the worker's level, timing the search. """
+    start = time()
+    path = dijkstras_shortest_path_array(query[0], query[1], worker_grid)
+    return path, time() - start
+
+
+def batch_routes(grid, queries, processes=None, chunksize=1):
+    """ Answers many route queries against one level in a pool of worker processes.
+
+    The level's arrays are copied once into shared memory, which every worker maps, rather than being pickled and
+    sent to each worker.
+
+    Args:
+        grid: A level loaded by load_level_array or stream_level_array.
+        queries: A list of (src, dst) pairs of flat cell indices.
+        processes: The number of worker processes (defaults to the number of cores).
+        chunksize: The number of queries handed to a worker at a time.
+
+    Returns:
+        A list with one (path, seconds) pair per query, in the same order as queries, where path is as returned by
+        dijkstras_shortest_path_array and seconds is how long that search took.
+    """
+    costs, walls = grid['costs'], grid['walls']
+    memory = SharedMemory(create=True, size=costs.nbytes + walls.nbytes)
+    try:
+        numpy.ndarray(costs.shape, dtype=numpy.float32, buffer=memory.buf)[:] = costs
+        numpy.ndarray(walls.shape, dtype=numpy.bool_, buffer=memory.buf, offset=costs.nbytes)[:] = walls
+        with Pool(processes, initializer=init_worker, initargs=(memory.name, costs.shape, grid['waypoints'])) as pool:
+            return pool.map(run_query, queries, chunksize)
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+if __name__ == '__main__':
+    grid = stream_level_array('test_maze.txt', cache=False)
+    random.seed(0)
+    cells = numpy.flatnonzero(~grid['walls'].reshape(-1)).tolist()
+    queries = [(random.choice(cells), random.choice(cells)) for _ in range(32)]
+
+    start = time()
+    results = batch_routes(grid, queries)
+    elapsed = time() - start
+
+    print("Answered %d queries in %.2fs (%.2fs of searching)." % (len(results), elapsed,
+                                                                sum(seconds for _, seconds in results)))
@@ -0,0 +1,281 @@
+# Synthetic mazes and a scaling benchmark for P1 search
+
+import json
+import random
+import sys
+import tracemalloc
+from math import inf
+from os.path import join
+from tempfile import TemporaryDirectory
+from timeit import default_timer as time
+
+from p1 import SEARCH_MODES, dijkstras_shortest_path, dijkstras_shortest_path_to_all, jump_point_search, \
+    navigation_edges
+from p1_alt import alt_heuristic, build_landmarks
+from p1_ch import build_hierarchy, ch_shortest_path
+from p1_grid import dijkstras_shortest_path_array, array_navigation_edges, cell_to_index, index_to_cell, \
+    load_level_array
+from p1_hpa import build_abstraction, hpa_shortest_path
+from p1_support import WALL, load_level
+
+# maze sizes benchmarked by default, and every size generate_maze is meant for
+SIZES = (32, 64, 128, 256)
+ALL_SIZES = (32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+# (wall density, cost noise) pairs every size is benchmarked with
+VARIANTS = ((1.0, 0.0), (0.5, 0.3), (0.1, 0.8))
+
+# everything run_benchmark times: the point-to-point modes, the full sweep and the adjacency function alone, then the
+# preprocessing the alt, hpa and ch modes rely on
+BENCHMARK_MODES = SEARCH_MODES + ('jps', 'array', 'alt', 'hpa', 'ch', 'to_all', 'edges',
+                                  'alt_build', 'hpa_build', 'ch_build')
+
+# modes whose paths may cost more than the shortest, so compare_results only reports them getting costlier
+APPROXIMATE_MODES = ('hpa',)
+
+# how much slower (or hungrier) than the baseline a run may be before compare_results reports it, and the shortest
+# baseline time compared at all (anything quicker is mostly noise)
+TOLERANCE = 0.25
+MIN_SECONDS = 0.05
+
+
+def generate_maze(size, wall_density=1.0, noise=0.0, seed=0):
+    """ Generates a square maze in the P1 level format.
+
+    A perfect maze is carved out of the grid by a randomized depth-first search, so every open cell is reachable,
+    then some of its walls are knocked through to open up loops.
+
+    Args:
+        size: The width and height of the maze, in cells.
+        wall_density: The fraction of the maze's inner walls kept (1 for a perfect maze, 0 for open rooms of pillars).
+        noise: The fraction of open cells given a random cost from 2 to 9 instead of 1.
+        seed: The seed of the random number generator, so the same arguments always give the same maze.
+
+    Returns:
+        A list of the maze's lines, with waypoint a in the top left corner and b in the bottom right.
+    """
+    rng = random.Random(seed)
+    cells = (size - 1) // 2  # rooms per side, at odd coordinates
+    grid = [[WALL] * size for _ in range(size)]
+
+    # carve a perfect maze through the rooms
+    grid[1][1] = '1'
+    stack = [(1, 1)]
+    while stack:
+        x, y = stack[-1]
+        options = [(dx, dy) for dx, dy in ((2, 0), (-2, 0), (0, 2), (0, -2))
+                   if 0 < x + dx < 2 * cells and 0 < y + dy < 2 * cells and grid[y + dy][x + dx] == WALL]
+        if not options:
+            stack.pop()
+            continue
+        dx, dy = rng.choice(options)
+        grid[y + dy // 2][x + dx // 2] = grid[y + dy][x + dx] = '1'
+        stack.append((x + dx, y + dy))
+
+    # knock through walls between rooms, never pillars or the border
+    for y in range(1, 2 * cells):
+        for x in range(1 + y % 2, 2 * cells, 2):
+            if grid[y][x] == WALL and rng.random() >= wall_density:
+                grid[y][x] = '1'
+
+    for row in grid:
+        for x, char in enumerate(row):
+            if char != WALL and rng.random() < noise:
+                row[x] = str(rng.randint(2, 9))
+
+    grid[1][1] = 'a'
+    grid[2 * cells - 1][2 * cells - 1] = 'b'
+    return [''.join(row) for row in grid]
+
+
+def build_data(level, mode, filename=None):
+    """ Runs the preprocessing a benchmark mode needs, so that it can be left out of the mode's own timing.
+
+    Args:
+        level: The loaded level.
+        mode: The mode the data is for.
+        filename: The level's file, which the 'array' mode loads its grid from.
+
+    Returns:
+        The grid for 'array', the landmark table for 'alt', the abstraction for 'hpa', the hierarchy for 'ch', and
+        None for every other mode.
+    """
+    if mode == 'array':
+        return load_level_array(filename)
+    if mode == 'alt':
+        return build_landmarks(level)
+    if mode == 'hpa':
+        return build_abstraction(level)
+    if mode == 'ch':
+        return build_hierarchy(level)
+    return None
+
+
+def run_mode(level, mode, data=None):
+    """ Runs one benchmark mode once over a level from waypoint a (to waypoint b).
+
+    Args:
+        level: The loaded level.
+        mode: The mode to run, from BENCHMARK_MODES.
+        data: The mode's preprocessed data, as returned by build_data.
+
+    Returns:
+        The number of nodes the mode expanded (cells reached for 'to_all', calls made for 'edges', spaces of the
+        level for the build modes), and the cost of the path it found (None for modes which do not find one).
+    """
+    src, dst = level['waypoints']['a'], level['waypoints']['b']
+    stats = {}
+
+    if mode == 'to_all':
+        costs = dijkstras_shortest_path_to_all(src, level, navigation_edges)
+        return len(costs), costs.get(dst)
+    if mode == 'edges':
+        for cell in level['spaces']:
+            navigation_edges(level, cell)
+        return len(level['spaces']), None
+    if mode.endswith('_build'):
+        build_data(level, mode[:-len('_build')])
+        return len(level['spaces']), None
+
+    if mode == 'jps':
+        path = jump_point_search(src, dst, level, stats=stats)
+    elif mode == 'array':
+        # the array search keeps no stats, so count the cells it expands through its adjacency function
+        def adj(grid, index):
+            stats['expanded'] = stats.get('expanded', 0) + 1
+            return array_navigation_edges(grid, index)
+
+        path = dijkstras_shortest_path_array(cell_to_index(data, src), cell_to_index(data, dst), data, adj)
+        path = path and [index_to_cell(data, index) for index in path]
+    elif mode == 'alt':
+        path = dijkstras_shortest_path(src, dst, level, navigation_edges, 'astar', alt_heuristic(data, level), stats)
+    elif mode == 'hpa':
+        path = hpa_shortest_path(src, dst, level, data, stats=stats)
+    elif mode == 'ch':
+        path = ch_shortest_path(src, dst, data, stats)
+    else:
+        path = dijkstras_shortest_path(src, dst, level, navigation_edges, mode, stats=stats)
+    cost = None
+    if path:
+        cost = sum(dict(navigation_edges(level, a))[b] for a, b in zip(path, path[1:]))
+    return stats['expanded'], cost
+
+
+def run_benchmark(sizes=SIZES, variants=VARIANTS, modes=BENCHMARK_MODES, seed=0, runs=3, memory=True):
+    """ Generates a maze for every size and variant and measures every mode over each one.
+
+    Each mode is timed on its own (keeping the fastest of several runs), then run again under tracemalloc to measure
+    its peak memory, since tracing slows everything down. The preprocessing a mode needs is built once per maze
+    beforehand, and only timed by the matching build mode.
+
+    Args:
+        sizes: The maze sizes to benchmark.
+        variants: The (wall density, cost noise) pairs to benchmark every size with.
+        modes: The modes to run, from BENCHMARK_MODES.
+        seed: The seed passed on to generate_maze.
+        runs: The number of times each mode is timed.
+        memory: Whether to measure peak memory.
+
+    Returns:
+        A list of results (dicts), one per maze and mode, holding the maze settings, the mode, the wall time in
+        seconds, the nodes expanded, the peak memory in bytes (None if not measured), and the path cost found.
+    """
+    results = []
+    with TemporaryDirectory() as directory:
+        for size in sizes:
+            for wall_density, noise in variants:
+                filename = join(directory, 'maze.txt')
+                with open(filename, 'w') as f:
+                    f.write('\n'.join(generate_maze(size, wall_density, noise, seed)) + '\n')
+                level = load_level(filename)
+
+                for mode in modes:
+                    data = build_data(level, mode, filename)
+                    seconds = inf
+                    for _ in range(runs):
+                        start = time()
+                        expanded, cost = run_mode(level, mode, data)
+                        seconds = min(seconds, time() - start)
+
+                    peak = None
+                    if memory:
+                        tracemalloc.start()
+                        run_mode(level, mode, data)
+                        peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+
+                    results.append({'size': size, 'wall_density': wall_density, 'noise': noise, 'seed': seed,
+                                    'mode': mode, 'seconds': seconds, 'expanded': expanded, 'peak_bytes': peak,
+                                    'cost': cost})
+                    print("%5d %.2f %.2f %-13s %8.3fs %9d nodes %s" % (
+                        size, wall_density, noise, mode, seconds, expanded,
+                        '' if peak is None else '%.1f MiB' % (peak / 2 ** 20)))
+    return results
+
+
+def compare_results(results, baseline, tolerance=TOLERANCE):
+    """ Compares benchmark results with a baseline run over the same mazes.
+
+    Args:
+        results: The results of run_benchmark.
+        baseline: Earlier results of run_benchmark.
+        tolerance: The fraction by which time or peak memory may grow before it counts as a regression.
+
+    Returns:
+        A list of messages, one per regression found: a mode running slower, expanding more nodes, using more
+        memory, or finding a different path cost than it did in the baseline (a costlier one, for APPROXIMATE_MODES).
+    """
+    def key(result):
+        return result['size'], result['wall_density'], result['noise'], result['seed'], result['mode']
+
+    before = {key(result): result for result in baseline}
+    regressions = []
+
+    for result in results:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        name = "%d %.2f %.2f seed %d %s" % key(result)
+
+        if old['seconds'] >= MIN_SECONDS and result['seconds'] > old['seconds'] * (1 + tolerance):
+            regressions.append("%s: %.3fs, was %.3fs" % (name, result['seconds'], old['seconds']))
+        if result['expanded'] > old['expanded']:
+            regressions.append("%s: expanded %d nodes, was %d" % (name, result['expanded'], old['expanded']))
+        if result['peak_bytes'] is not None and old['peak_bytes'] is not None and \
+                result['peak_bytes'] > old['peak_bytes'] * (1 + tolerance):
+            regressions.append("%s: peak memory %d bytes, was %d" % (name, result['peak_bytes'], old['peak_bytes']))
+        if (result['cost'] is None) != (old['cost'] is None):
+            regressions.append("%s: path cost %s, was %s" % (name, result['cost'], old['cost']))
+        elif result['cost'] is not None:
+            change = result['cost'] - old['cost']
+            if result['mode'] in APPROXIMATE_MODES:
+                change = max(0, change)
+            if abs(change) > 1e-6 * max(1, old['cost']):
+                regressions.append("%s: path cost %s, was %s" % (name, result['cost'], old['cost']))
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    if not 2 <= len(sys.argv) <= 4:
+        print("usage: %s output_json [baseline_json] [max_size]" % sys.argv[0])
+        sys.exit(-1)
+
+    output_filename = sys.argv[1]
+    baseline_filename = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] != '-' else None
+    max_size = int(sys.argv[3]) if len(sys.argv) > 3 else max(SIZES)
+
+    results = run_benchmark([size for size in ALL_SIZES if size <= max_size])
+    with open(output_filename, 'w') as f:
+        json.dump(results, f, indent=1)
+    print("Saved file:", output_filename)
+
+    if baseline_filename:
+        with open(baseline_filename, 'r') as f:
+            regressions = compare_results(results, json.load(f))
+        for message in regressions:
+            print("Regression:", message)
+        print("%d regressions against %s." % (len(regressions), baseline_filename))
+        if regressions:
+            sys.exit(1)
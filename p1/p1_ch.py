@@ -0,0 +1,218 @@
+# Contraction hierarchies for static P1 levels
+
+from array import array
+from math import inf
+from heapq import heappop, heappush
+
+from p1 import compile_level, compiled_edges, navigation_edges
+from p1_support import cached_level_data, level_hash, load_level, show_level
+
+# the number of nodes a witness search may settle before giving up (and adding the shortcut to be safe)
+WITNESS_LIMIT = 64
+
+
+def build_hierarchy(level, adj=navigation_edges):
+    """ Contracts the nodes of a level one at a time, adding shortcuts so shortest paths survive each contraction.
+
+    Nodes are contracted in order of edge difference (shortcuts added minus edges removed) plus the number of their
+    neighbours already contracted, which is updated lazily. Before adding a shortcut u-w around v, a small search
+    from u looks for a path to w which avoids v and costs no more; if it finds one the shortcut is skipped.
+
+    Args:
+        level: A loaded level, containing walls, spaces, and waypoints.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+
+    Returns:
+        The hierarchy (dict), containing the cell of every node and a mapping of cells to nodes (as compile_level
+        numbers them), the rank of every node, the upward graph in compressed-sparse-row form (offsets, targets and
+        weights of the edges from each node to higher ranked ones), and the middle node of every shortcut.
+    """
+    graph = compile_level(level, adj)
+    count = len(graph['cells'])
+
+    # the remaining graph, as node -> {neighbour: (weight, middle node or -1)}
+    remaining = [{} for _ in range(count)]
+    for node in range(count):
+        for pos, cost in compiled_edges(graph, node):
+            if pos != node and cost < remaining[node].get(pos, (inf,))[0]:
+                remaining[node][pos] = (cost, -1)
+
+    def witness_search(source, excluded, max_cost):
+        dist = {source: 0}
+        q = [(0, source)]
+        settled = 0
+        while q and settled < WITNESS_LIMIT:
+            cur_dist, cur = heappop(q)
+            if cur_dist > dist[cur]:
+                continue
+            if cur_dist > max_cost:
+                break
+            settled += 1
+            for pos, (cost, _) in remaining[cur].items():
+                if pos != excluded and cur_dist + cost < dist.get(pos, inf):
+                    dist[pos] = cur_dist + cost
+                    heappush(q, (cur_dist + cost, pos))
+        return dist
+
+    def shortcuts(node):
+        # the shortcuts contracting node would need right now
+        neighbours = sorted(remaining[node].items())
+        needed = []
+        for i, (u, (to_u, _)) in enumerate(neighbours[:-1]):
+            targets = neighbours[i + 1:]
+            dist = witness_search(u, node, to_u + max(cost for _, (cost, _) in targets))
+            needed.extend((u, w, to_u + to_w) for w, (to_w, _) in targets if dist.get(w, inf) > to_u + to_w)
+        return needed
+
+    deleted = [0] * count
+
+    def priority(node):
+        return len(shortcuts(node)) - len(remaining[node]) + deleted[node]
+
+    q = [(priority(node), node) for node in range(count)]
+    q.sort()
+    rank = array('q', [0] * count)
+    up = [None] * count
+    middle = {}
+    contracted = 0
+
+    while q:
+        _, node = heappop(q)
+        new_priority = priority(node)
+        if q and new_priority > q[0][0]:  # priority went stale, put it back
+            heappush(q, (new_priority, node))
+            continue
+
+        for u, w, cost in shortcuts(node):
+            if cost < remaining[u].get(w, (inf,))[0]:
+                remaining[u][w] = remaining[w][u] = (cost, node)
+                middle[min(u, w), max(u, w)] = node
+
+        up[node] = remaining[node]
+        for pos in up[node]:
+            del remaining[pos][node]
+            deleted[pos] += 1
+        remaining[node] = {}
+        rank[node] = contracted
+        contracted += 1
+
+    offsets = array('q', [0])
+    targets = array('q')
+    weights = array('d')
+    for node in range(count):
+        for pos, (cost, _) in sorted(up[node].items()):
+            targets.append(pos)
+            weights.append(cost)
+        offsets.append(len(targets))
+
+    return {'cells': graph['cells'],
+            'index': graph['index'],
+            'rank': rank,
+            'offsets': offsets,
+            'targets': targets,
+            'weights': weights,
+            'middle': middle}
+
+
+def load_hierarchy(filename):
+    """ Loads the contraction hierarchy of a level file, building and caching it first if needed.
+
+    The hierarchy is cached next to the level as filename + '.ch.pickle' (see cached_level_data).
+
+    Args:
+        filename: The name of the text file containing the level.
+
+    Returns:
+        The hierarchy (dict) as built by build_hierarchy.
+    """
+    return cached_level_data(filename, '.ch.pickle', [level_hash(filename)], build_hierarchy)
+
+
+def unpack_edge(hierarchy, a, b):
+    """ Expands an edge of the hierarchy into the nodes of the original path it stands for, from a up to b. """
+    nodes = [a]
+    stack = [b]
+    while stack:  # depth first, so the path comes out in order
+        top = stack[-1]
+        m = hierarchy['middle'].get((min(nodes[-1], top), max(nodes[-1], top)))
+        if m is None:
+            nodes.append(stack.pop())
+        else:
+            stack.append(m)
+    return nodes
+
+
+def ch_shortest_path(initial_position, destination, hierarchy, stats=None):
+    """ Searches for a minimal cost path through a level using its contraction hierarchy.
+
+    Two Dijkstra searches, one from each end, only ever follow edges up the hierarchy, and meet at the highest ranked
+    node of the shortest path. The path found is then unpacked from shortcuts into cells.
+
+    Args:
+        initial_position: The initial cell from which the path extends.
+        destination: The end location for the path.
+        hierarchy: The level's hierarchy, as returned by build_hierarchy or load_hierarchy.
+        stats: An optional dictionary which receives the number of nodes the search settled under 'expanded'.
+
+    Returns:
+        If a path exits, return a list containing all cells from initial_position to destination.
+        Otherwise, return None.
+
+    """
+    index, offsets, targets, weights = (hierarchy[key] for key in ('index', 'offsets', 'targets', 'weights'))
+    if initial_position not in index or destination not in index:
+        return None
+    source, target = index[initial_position], index[destination]
+
+    searches = [({source: (0, None)}, [(0, source)]), ({target: (0, None)}, [(0, target)])]
+    best, meet = (0, source) if source == target else (inf, None)
+    expanded = 0
+
+    while any(q and q[0][0] < best for _, q in searches):
+        for side, (visited, q) in enumerate(searches):
+            if not q or q[0][0] >= best:
+                continue
+            cur_dist, cur = heappop(q)
+            if cur_dist > visited[cur][0]:  # skip stale queue entries
+                continue
+            expanded += 1
+            other = searches[1 - side][0]
+            if cur in other and cur_dist + other[cur][0] < best:  # the searches met
+                best, meet = cur_dist + other[cur][0], cur
+            for i in range(offsets[cur], offsets[cur + 1]):
+                pathcost = cur_dist + weights[i]
+                if targets[i] not in visited or pathcost < visited[targets[i]][0]:
+                    visited[targets[i]] = (pathcost, cur)
+                    heappush(q, (pathcost, targets[i]))
+
+    if stats is not None:
+        stats['expanded'] = expanded
+    if meet is None:
+        return None
+
+    # walk back from the meeting node to each end, then unpack every edge along the way
+    halves = []
+    for visited, _ in searches:
+        half = [meet]
+        while visited[half[-1]][1] is not None:
+            half.append(visited[half[-1]][1])
+        halves.append(half)
+    route = halves[0][::-1] + halves[1][1:]
+
+    nodes = [route[0]]
+    for a, b in zip(route, route[1:]):
+        nodes.extend(unpack_edge(hierarchy, a, b)[1:])
+    return [hierarchy['cells'][node] for node in nodes]
+
+
+if __name__ == '__main__':
+    filename, src_waypoint, dst_waypoint = 'example.txt', 'a', 'e'
+    level = load_level(filename)
+    hierarchy = load_hierarchy(filename)
+    stats = {}
+    path = ch_shortest_path(level['waypoints'][src_waypoint], level['waypoints'][dst_waypoint], hierarchy, stats)
+    if path:
+        show_level(level, path)
+    else:
+        print("No path possible!")
+    print("Settled %d nodes." % stats['expanded'])
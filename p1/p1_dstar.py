@@ -0,0 +1,229 @@
+# Incremental replanning for P1 using D* Lite
+
+import random
+import sys
+from collections import deque
+from math import inf
+from heapq import heappop, heappush
+
+from p1 import DIRECTIONS, dijkstras_sweep, navigation_edges, octile_heuristic, reconstruct_path
+from p1_support import load_level, show_level, update_cell
+
+# queue keys whose first parts are this close count as tied: km piles up rounding error as the agent moves, so keys
+# which ought to be equal can differ in their last bits
+KEY_TOLERANCE = 1e-9
+
+
+class DStarLite:
+    def __init__(self, level, start, goal, adj=navigation_edges):
+        """ Initializes a D* Lite planner over a loaded level. The planner searches backwards from the goal and keeps
+        its shortest-path tree between calls, so after cells change only the affected part of the tree is repaired.
+
+        Args:
+            level:  A loaded level, containing walls, spaces, and waypoints. The planner edits it in place.
+            start:  The cell the agent is currently in.
+            goal:   The cell the agent is heading to.
+            adj:    An adjacency function returning cells adjacent to a given cell as well as their edge costs.
+
+        """
+        self.level = level
+        self.start = start
+        self.goal = goal
+        self.adj = adj
+        self.expanded = 0       # Number of nodes expanded over the planner's lifetime
+        self.reset()
+
+    def reset(self):
+        """ Throws away the shortest-path tree, so the next call to plan searches from scratch. """
+        self.h = octile_heuristic(self.level)
+        self.scale = min(self.level['spaces'].values(), default=0)
+        self.g = {}
+        self.rhs = {self.goal: 0}
+        self.km = 0             # Key modifier, grows as the agent moves so old queue keys stay valid
+        self.last = self.start
+        self.queue = []
+        self.queued = {}        # Cell -> current key of its live queue entry
+        self.push(self.goal)
+
+    def key(self, cell):
+        best = min(self.g.get(cell, inf), self.rhs.get(cell, inf))
+        return best + self.h(self.start, cell) + self.km, best
+
+    def push(self, cell):
+        key = self.key(cell)
+        self.queued[cell] = key
+        heappush(self.queue, (key, cell))
+
+    def top_key(self):
+        # drop entries which were removed or re-keyed since they were pushed
+        while self.queue and self.queued.get(self.queue[0][1]) != self.queue[0][0]:
+            heappop(self.queue)
+        return self.queue[0][0] if self.queue else (inf, inf)
+
+    def successors(self, cell):
+        if cell not in self.level['spaces']:
+            return []
+        return [(pos, cost) for pos, cost in self.adj(self.level, cell) if cost is not inf]
+
+    def neighbours(self, cell):
+        return [(cell[0] + dx, cell[1] + dy) for dx, dy in DIRECTIONS]
+
+    def update_vertex(self, cell):
+        if cell != self.goal:
+            self.rhs[cell] = min((cost + self.g.get(pos, inf) for pos, cost in self.successors(cell)), default=inf)
+        self.queued.pop(cell, None)
+        if self.g.get(cell, inf) != self.rhs.get(cell, inf):
+            self.push(cell)
+
+    def compute_shortest_path(self):
+        # cells tied with the start on k1 are processed whatever their k2, since the heap orders keys exactly and may
+        # put a near-tie with a larger k2 ahead of one with a smaller k2
+        while (self.top_key()[0] <= self.key(self.start)[0] + KEY_TOLERANCE and self.queue) or \
+                self.rhs.get(self.start, inf) != self.g.get(self.start, inf):
+            old_key, cell = heappop(self.queue)
+            del self.queued[cell]
+            new_key = self.key(cell)
+            if old_key[0] < new_key[0] - KEY_TOLERANCE:  # key is out of date since the agent moved
+                self.queued[cell] = new_key
+                heappush(self.queue, (new_key, cell))
+                continue
+            self.expanded += 1
+            if self.g.get(cell, inf) > self.rhs[cell]:  # overconsistent, settle it
+                self.g[cell] = self.rhs[cell]
+                for pos in self.neighbours(cell):
+                    if pos in self.level['spaces']:
+                        self.update_vertex(pos)
+            else:  # underconsistent, raise it and let its neighbours find new parents
+                self.g[cell] = inf
+                for pos in self.neighbours(cell) + [cell]:
+                    if pos in self.level['spaces']:
+                        self.update_vertex(pos)
+
+    def move_to(self, cell):
+        """ Records that the agent has moved to the given cell.
+
+        Args:
+            cell:   The agent's new location.
+
+        """
+        self.km += self.h(self.last, cell)
+        self.last = cell
+        self.start = cell
+
+    def update_cells(self, changes):
+        """ Applies cell cost changes to the level and marks the affected part of the tree for repair.
+
+        Args:
+            changes:    A dictionary mapping cells to their new cost (inf turns a cell into a wall).
+
+        """
+        for cell, cost in changes.items():
+            update_cell(self.level, cell, cost)
+
+        if any(cost < self.scale for cost in changes.values()) or not self.scale:
+            # the heuristic would overestimate now, or '0' cells let cells on a free plateau prop up each other's stale
+            # costs, so the old tree cannot be trusted
+            self.reset()
+            return
+
+        dirty = set()
+        for cell in changes:
+            dirty.add(cell)
+            dirty.update(self.neighbours(cell))
+        for cell in dirty:
+            if cell in self.level['spaces'] or cell in self.g or cell in self.rhs:
+                self.update_vertex(cell)
+
+    def plan(self):
+        """ Repairs the shortest-path tree and follows it from the agent to the goal.
+
+        Returns:    A list containing all cells from the agent's location to the goal, or None if the goal cannot
+                    be reached.
+        """
+        self.compute_shortest_path()
+        if self.g.get(self.start, inf) == inf:
+            return None
+
+        # follow the edges the tree is consistent along breadth first, so that successors tied on cost (as between
+        # '0' cells) can never send the walk round in circles
+        prev = {self.start: None}
+        frontier = deque([self.start])
+        while frontier and self.goal not in prev:
+            cell = frontier.popleft()
+            for pos, cost in self.successors(cell):
+                if pos not in prev and cost + self.g.get(pos, inf) <= self.g[cell] + KEY_TOLERANCE:
+                    prev[pos] = cell
+                    frontier.append(pos)
+        assert self.goal in prev, "Error: the planner's tree does not lead to the goal."
+        return reconstruct_path(prev, self.goal)
+
+
+def check_replanning(filename, seed=0, trials=3, ticks=20, edits=5, costs=(inf, 1, 2, 3, 5, 9)):
+    """ Checks the planner against fresh searches while it walks a level under random edits.
+
+    Each trial plans between two random waypoints, then every tick moves the agent a step along its path and turns a
+    few random inner cells (never the agent's or the goal's) into walls or spaces of a random cost.
+
+    Args:
+        filename: The name of the text file containing the level.
+        seed: The seed of the random number generator, so the same arguments always make the same edits.
+        trials: The number of walks.
+        ticks: The most steps each walk takes.
+        edits: The number of cells changed every tick.
+        costs: The costs the changed cells are given (inf for walls).
+
+    Returns:
+        A list of messages, one per tick where the cost the planner found, or the cost of the path it returned,
+        differs from a fresh dijkstras_sweep's.
+    """
+    rng = random.Random(seed)
+    mismatches = []
+
+    for trial in range(trials):
+        level = load_level(filename)
+        cells = list(level['spaces']) + list(level['walls'])
+        xs, ys = zip(*cells)
+        (x_lo, x_hi), (y_lo, y_hi) = (min(xs), max(xs)), (min(ys), max(ys))
+        inner = sorted(cell for cell in cells if x_lo < cell[0] < x_hi and y_lo < cell[1] < y_hi)
+        start, goal = (level['waypoints'][name] for name in rng.sample(sorted(level['waypoints']), 2))
+        planner = DStarLite(level, start, goal)
+
+        for tick in range(ticks):
+            path = planner.plan()
+            expected = dijkstras_sweep(planner.start, level, navigation_edges)[0].get(goal, inf)
+            found = planner.g.get(planner.start, inf)
+            walked = sum(dict(navigation_edges(level, a))[b] for a, b in zip(path, path[1:])) if path else inf
+            for name, cost in (('cost', found), ('path cost', walked)):
+                if cost != expected and abs(cost - expected) > 1e-6:
+                    mismatches.append("seed %d trial %d tick %d: %s %s, fresh search %s" % (
+                        seed, trial, tick, name, cost, expected))
+            if not path or len(path) < 2:
+                break
+
+            planner.move_to(path[1])
+            planner.update_cells({cell: rng.choice(costs) for cell in rng.sample(inner, edits)
+                                  if cell not in (planner.start, goal)})
+
+    return mismatches
+
+
+if __name__ == '__main__':
+    level = load_level('example.txt')
+    planner = DStarLite(level, level['waypoints']['c'], level['waypoints']['b'])
+    path = planner.plan()
+    show_level(level, path)
+
+    # block the middle of the route and let the planner repair around it
+    planner.move_to(path[1])
+    planner.update_cells({path[len(path) // 2]: inf})
+    show_level(level, planner.plan())
+    print("Expanded %d nodes." % planner.expanded)
+
+    # check incremental repairs, then with '0' cells around (where the planner has to search from scratch)
+    mismatches = [message for costs in ((inf, 1, 2, 3, 5, 9), (inf, 0, 1, 2, 5))
+                  for seed in range(10) for message in check_replanning('my_maze.txt', seed, costs=costs)]
+    for message in mismatches:
+        print("Mismatch:", message)
+    print("%d mismatches against fresh searches." % len(mismatches))
+    if mismatches:
+        sys.exit(1)
@@ -0,0 +1,92 @@
+# Flow fields for many P1 agents heading to the same place
+
+from p1 import multi_source_sweep, navigation_edges
+from p1_support import load_level, show_level
+
+
+def build_flow_field(level, destinations, adj=navigation_edges):
+    """ Works out, for every cell of a level, which way to step to reach the nearest destination most cheaply.
+
+    A single sweep outwards from the destinations settles every cell; since edge costs are the same in both
+    directions, the predecessor of a cell in that sweep is its next step towards a destination.
+
+    Args:
+        level: A loaded level, containing walls, spaces, and waypoints.
+        destinations: The cells agents are heading to.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+
+    Returns:
+        The flow field (dict), mapping every cell that can reach a destination to the cost of getting there and to
+        the (dx, dy) step to take from it ((0, 0) at the destinations themselves).
+    """
+    dist, prev = multi_source_sweep(destinations, level, adj)
+    directions = {cell: (0, 0) if nxt is None else (nxt[0] - cell[0], nxt[1] - cell[1]) for cell, nxt in prev.items()}
+    return {'destinations': tuple(destinations),
+            'costs': dist,
+            'directions': directions,
+            'revision': level.get('revision', 0)}
+
+
+def follow(field, cell):
+    """ Gives the next cell an agent at the given cell should move to, or None if it has arrived or cannot arrive. """
+    dx, dy = field['directions'].get(cell, (0, 0))
+    if not dx and not dy:
+        return None
+    return cell[0] + dx, cell[1] + dy
+
+
+def field_path(field, cell):
+    """ Follows a flow field from the given cell all the way to a destination, returning every cell on the way. """
+    if cell not in field['directions']:
+        return None
+    path = [cell]
+    while True:
+        cell = follow(field, cell)
+        if cell is None:
+            return path
+        path.append(cell)
+
+
+class FlowFieldCache:
+    def __init__(self, level, adj=navigation_edges):
+        """ Initializes a cache of flow fields over a loaded level, one per set of destinations. Fields are rebuilt
+        once the level's revision (bumped by p1_support.update_cell) moves on from the one they were built at.
+
+        Args:
+            level:  A loaded level, containing walls, spaces, and waypoints.
+            adj:    An adjacency function returning cells adjacent to a given cell as well as their edge costs.
+
+        """
+        self.level = level
+        self.adj = adj
+        self.fields = {}    # Destinations -> flow field
+
+    def get(self, destinations):
+        """ Returns the flow field towards the given destinations, building it first if needed.
+
+        Args:
+            destinations:   The cells agents are heading to.
+
+        Returns:            The flow field, as returned by build_flow_field.
+        """
+        key = tuple(sorted(destinations))
+        field = self.fields.get(key)
+        if field is None or field['revision'] != self.level.get('revision', 0):
+            field = self.fields[key] = build_flow_field(self.level, key, self.adj)
+        return field
+
+    def invalidate(self):
+        """ Throws away every cached field, for changes to the level made without p1_support.update_cell. """
+        self.fields.clear()
+
+
+if __name__ == '__main__':
+    level = load_level('example.txt')
+    fields = FlowFieldCache(level)
+    field = fields.get([level['waypoints']['e']])
+    for waypoint in 'abc':
+        path = field_path(field, level['waypoints'][waypoint])
+        if path:
+            show_level(level, path)
+        else:
+            print("No path possible from %s!" % waypoint)
@@ -0,0 +1,249 @@
+# Array-backed level representation for P1
+
+import json
+from math import inf, sqrt
+from heapq import heappop, heappush
+from os import stat
+from os.path import exists
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from p1_support import COST_MAP_HEADER, COST_MAP_MAGIC, WALL
+
+# cost of every character that can appear in a level file; anything else is impassable
+CHAR_COSTS = numpy.full(256, inf, dtype=numpy.float32)
+CHAR_COSTS[ord('0'):ord('9') + 1] = numpy.arange(10, dtype=numpy.float32)
+CHAR_COSTS[ord('a'):ord('z') + 1] = 1.
+CHAR_COSTS[ord(WALL)] = inf
+
+
+def level_steps(width):
+    """ Lists the flat index offsets of the 8 neighbours of a cell in a grid of the given width.
+
+    Args:
+        width: The number of columns in the grid.
+
+    Returns:
+        A list of (offset, dx, factor) tuples, in the same order navigation_edges visits neighbours, where factor
+        scales the summed cost of both cells into the cost of the edge joining them.
+    """
+    return [(dy * width + dx, dx, sqrt(2) * 0.5 if dx and dy else 0.5)
+            for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+def parse_row(line):
+    """ Converts one line of a level file into a row of cell costs.
+
+    Args:
+        line: A line of the level file, without its newline.
+
+    Returns:
+        A float32 array of cell costs (inf for walls) and a dictionary mapping waypoint characters to columns.
+    """
+    codes = numpy.frombuffer(line.encode('latin-1'), dtype=numpy.uint8)
+    row = CHAR_COSTS[codes]
+    columns = numpy.flatnonzero((codes >= ord('a')) & (codes <= ord('z')))
+    return row, {line[i]: int(i) for i in columns}
+
+
+def make_grid(costs, waypoints, walls=None):
+    """ Wraps a cost grid into the array level representation used by the search functions in this module.
+
+    Args:
+        costs: A 2D float32 array of cell costs, indexed [row, column], with inf marking walls.
+        waypoints: A dictionary mapping waypoint characters to flat cell indices.
+        walls: The matching boolean wall mask, if it has already been worked out.
+
+    Returns:
+        The array level (dict).
+    """
+    height, width = costs.shape
+    return {'costs': costs,
+            'walls': numpy.isinf(costs) if walls is None else walls,
+            'waypoints': waypoints,
+            'width': width,
+            'flat': costs.reshape(-1),
+            'steps': level_steps(width)}
+
+
+def load_level_array(filename):
+    """ Loads a level from a given text file into dense arrays.
+
+    Args:
+        filename: The name of the txt file containing the maze.
+
+    Returns:
+        The loaded level (dict) containing a float32 cost grid (inf for walls), a boolean wall mask, and a mapping of
+        waypoints to flat cell indices (row * width + column).
+
+    """
+    with open(filename, "r") as f:
+        rows = [parse_row(line.rstrip('\n')) for line in f]
+
+    width = max((len(row) for row, _ in rows), default=0)
+    costs = numpy.full((len(rows), width), inf, dtype=numpy.float32)
+    waypoints = {}
+    for j, (row, points) in enumerate(rows):
+        costs[j, :len(row)] = row
+        waypoints.update({char: j * width + i for char, i in points.items()})
+
+    return make_grid(costs, waypoints)
+
+
+def stream_level_array(filename, cache=True):
+    """ Loads a level from a given text file into dense arrays, reading it one row at a time.
+
+    The file is read twice, once to measure it and once to fill in the grid, so the text of the level is never held
+    in memory. With cache enabled the grid is written straight into filename + '.costs.npy' and
+    filename + '.walls.npy' (with the waypoints in filename + '.grid.json'), and later loads memory-map those files
+    instead of parsing the text again, for as long as the level file keeps the same size and modification time.
+
+    Args:
+        filename: The name of the txt file containing the maze.
+        cache: Whether to read and write the cached binary form of the level.
+
+    Returns:
+        The loaded level (dict), as returned by load_level_array.
+
+    """
+    costs_filename, walls_filename, info_filename = (filename + suffix
+                                                     for suffix in ('.costs.npy', '.walls.npy', '.grid.json'))
+    source = stat(filename)
+    key = [source.st_size, source.st_mtime_ns]
+
+    if cache and exists(info_filename) and exists(costs_filename) and exists(walls_filename):
+        with open(info_filename, 'r') as f:
+            info = json.load(f)
+        if info['source'] == key:
+            return make_grid(numpy.load(costs_filename, mmap_mode='r'), info['waypoints'],
+                             numpy.load(walls_filename, mmap_mode='r'))
+
+    # measure the level
+    height = width = 0
+    with open(filename, "r") as f:
+        for line in f:
+            height += 1
+            width = max(width, len(line.rstrip('\n')))
+
+    if cache:
+        costs = open_memmap(costs_filename, mode='w+', dtype=numpy.float32, shape=(height, width))
+        walls = open_memmap(walls_filename, mode='w+', dtype=numpy.bool_, shape=(height, width))
+    else:
+        costs = numpy.empty((height, width), dtype=numpy.float32)
+        walls = numpy.empty((height, width), dtype=numpy.bool_)
+
+    # fill it in row by row
+    waypoints = {}
+    with open(filename, "r") as f:
+        for j, line in enumerate(f):
+            row, points = parse_row(line.rstrip('\n'))
+            costs[j, :len(row)] = row
+            costs[j, len(row):] = inf
+            walls[j] = numpy.isinf(costs[j])
+            waypoints.update({char: j * width + i for char, i in points.items()})
+
+    if cache:
+        costs.flush()
+        walls.flush()
+        with open(info_filename, 'w') as f:
+            json.dump({'source': key, 'waypoints': waypoints}, f)
+
+    return make_grid(costs, waypoints, walls)
+
+
+def load_cost_map(filename):
+    """ Loads a cost map saved by p1_support.save_level_costs in binary (.p1cm) form, without reading it into memory.
+
+    Args:
+        filename: The name of the p1cm file.
+
+    Returns:
+        A read-only float32 array memory-mapped over the file, indexed [row, column], and the (x, y) cell of its
+        first entry.
+
+    """
+    with open(filename, 'rb') as f:
+        magic, width, height, x_lo, y_lo = COST_MAP_HEADER.unpack(f.read(COST_MAP_HEADER.size))
+    assert magic == COST_MAP_MAGIC, 'Error: not a cost map file.'
+
+    costs = numpy.memmap(filename, dtype='<f4', mode='r', offset=COST_MAP_HEADER.size, shape=(height, width))
+    return costs, (x_lo, y_lo)
+
+
+def cell_to_index(grid, cell):
+    """ Converts an (x, y) cell as used by load_level into a flat index. """
+    return cell[1] * grid['width'] + cell[0]
+
+
+def index_to_cell(grid, index):
+    """ Converts a flat index into an (x, y) cell as used by load_level. """
+    return index % grid['width'], index // grid['width']
+
+
+def array_navigation_edges(grid, index):
+    """ Provides a list of adjacent cells and their respective costs from the given cell.
+
+    Args:
+        grid: A level loaded by load_level_array.
+        index: The flat index of a target location.
+
+    Returns:
+        A list of tuples containing an adjacent cell's flat index and the cost of the edge joining it and the
+        originating cell. Walls and cells off the grid are left out.
+    """
+    flat, width = grid['flat'], grid['width']
+    here = flat.item(index)
+    column = index % width
+    neighbors = []
+
+    for offset, dx, factor in grid['steps']:
+        # skip neighbours that would wrap around to the other side of the grid
+        if (dx < 0 and column == 0) or (dx > 0 and column == width - 1):
+            continue
+        n = index + offset
+        if 0 <= n < flat.size:
+            cost = flat.item(n)
+            if cost != inf:
+                neighbors.append((n, factor * (cost + here)))
+
+    return neighbors
+
+
+def dijkstras_shortest_path_array(initial_position, destination, grid, adj=array_navigation_edges):
+    """ Searches for a minimal cost path through an array level using Dijkstra's algorithm.
+
+    Args:
+        initial_position: The flat index of the initial cell from which the path extends.
+        destination: The flat index of the end location for the path.
+        grid: A level loaded by load_level_array.
+        adj: An adjacency function returning flat indices adjacent to a given index as well as their edge costs.
+
+    Returns:
+        If a path exits, return a list containing the flat indices of all cells from initial_position to destination.
+        Otherwise, return None.
+
+    """
+    dist = numpy.full(grid['flat'].size, inf)
+    prev = numpy.full(grid['flat'].size, -1, dtype=numpy.int64)
+    dist[initial_position] = 0
+    q = [(0, initial_position)]  # node queue
+
+    while q:
+        cur_dist, cur = heappop(q)
+        if cur == destination:  # check success
+            path = [cur]
+            while cur != initial_position:  # backpathing
+                cur = int(prev[cur])
+                path.append(cur)
+            path.reverse()
+            return path
+        if cur_dist > dist[cur]:  # skip stale queue entries
+            continue
+        for pos, cost in adj(grid, cur):  # for each neighbour
+            pathcost = cost + cur_dist
+            if pathcost < dist[pos]:
+                dist[pos] = pathcost
+                prev[pos] = cur
+                heappush(q, (pathcost, pos))
+    return None
@@ -0,0 +1,173 @@
+# Hierarchical pathfinding (HPA*) for large P1 levels
+
+from p1 import dijkstras_shortest_path, dijkstras_sweep, reconstruct_path, navigation_edges
+from p1_support import cached_level_data, level_hash, load_level, show_level
+from p1_waypoints import encode_path, decode_path
+
+# entrances wider than this get a transition at each end instead of one in the middle
+MAX_ENTRANCE_WIDTH = 6
+
+
+def cluster_of(abstraction, cell):
+    """ Finds the (column, row) of the cluster containing the given cell. """
+    size = abstraction['size']
+    return (cell[0] - abstraction['origin'][0]) // size, (cell[1] - abstraction['origin'][1]) // size
+
+
+def cluster_edges(abstraction, cluster, adj=navigation_edges):
+    """ Restricts an adjacency function to the cells of a single cluster. """
+    def edges(level, cell):
+        return [(pos, cost) for pos, cost in adj(level, cell) if cluster_of(abstraction, pos) == cluster]
+    return edges
+
+
+def build_abstraction(level, cluster_size=16, adj=navigation_edges):
+    """ Divides a level into square clusters and builds the abstract graph HPA* searches over.
+
+    Each run of open cells along a border between two clusters becomes an entrance, with one or two transitions
+    (pairs of cells facing each other across the border). The cells of every transition are the abstract nodes.
+    Nodes in neighbouring clusters are joined by the cost of stepping across the border, and nodes in the same
+    cluster by the cost of the cheapest path between them that stays inside the cluster.
+
+    Args:
+        level: A loaded level, containing walls, spaces, and waypoints.
+        cluster_size: The width and height of a cluster, in cells.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+
+    Returns:
+        The abstraction (dict), containing the cluster size and origin, the abstract nodes of every cluster, the
+        abstract edges of every node, and the cell path behind every edge inside a cluster (packed by encode_path).
+    """
+    spaces = level['spaces']
+    xs, ys = zip(*(list(spaces.keys()) + list(level['walls'])))
+    abstraction = {'size': cluster_size, 'origin': (min(xs), min(ys)), 'nodes': {}, 'edges': {}, 'paths': {}}
+    nodes, edges, paths = abstraction['nodes'], abstraction['edges'], abstraction['paths']
+
+    def add_transition(a, b):
+        cost = dict(adj(level, a))[b]
+        for cell, other in ((a, b), (b, a)):
+            nodes.setdefault(cluster_of(abstraction, cell), set()).add(cell)
+            edges.setdefault(cell, []).append((other, cost))
+
+    def add_entrance(run):
+        if len(run) < MAX_ENTRANCE_WIDTH:
+            add_transition(*run[len(run) // 2])
+        else:
+            add_transition(*run[0])
+            add_transition(*run[-1])
+
+    # scan every vertical border (between horizontally adjacent clusters) and every horizontal one
+    for axis in (0, 1):
+        lo, hi = (min(xs), max(xs)) if axis == 0 else (min(ys), max(ys))
+        across_lo, across_hi = (min(ys), max(ys)) if axis == 0 else (min(xs), max(xs))
+        for border in range(lo + cluster_size, hi + 1, cluster_size):
+            run = []
+            for along in range(across_lo, across_hi + 2):
+                a, b = ((border - 1, along), (border, along)) if axis == 0 else ((along, border - 1), (along, border))
+                # a run ends where either side is blocked or the border moves on to the next pair of clusters
+                if run and (a not in spaces or b not in spaces or
+                            cluster_of(abstraction, a) != cluster_of(abstraction, run[-1][0])):
+                    add_entrance(run)
+                    run = []
+                if a in spaces and b in spaces:
+                    run.append((a, b))
+                # a diagonal squeeze between two walls is an entrance of its own
+                for step in (-1, 1):
+                    c, d = ((border - 1, along + step), (border, along + step)) if axis == 0 else \
+                        ((along + step, border - 1), (along + step, border))
+                    if a in spaces and d in spaces and b not in spaces and c not in spaces:
+                        add_transition(a, d)
+
+    # join the nodes of each cluster by the cost of the paths between them
+    for cluster, cluster_nodes in nodes.items():
+        local = cluster_edges(abstraction, cluster, adj)
+        for node in cluster_nodes:
+            dist, prev = dijkstras_sweep(node, level, local)
+            for other in cluster_nodes:
+                if other != node and other in dist:
+                    edges[node].append((other, dist[other]))
+                    paths[node, other] = encode_path(reconstruct_path(prev, other))
+
+    abstraction['nodes'] = {cluster: sorted(cluster_nodes) for cluster, cluster_nodes in nodes.items()}
+    return abstraction
+
+
+def load_abstraction(filename, cluster_size=16):
+    """ Loads the HPA* abstraction of a level file, building and caching it first if needed.
+
+    The abstraction is cached next to the level as filename + '.hpa.pickle' (see cached_level_data), and rebuilt for
+    a different cluster size.
+
+    Args:
+        filename: The name of the text file containing the level.
+        cluster_size: The width and height of a cluster, in cells.
+
+    Returns:
+        The abstraction (dict) as built by build_abstraction.
+    """
+    return cached_level_data(filename, '.hpa.pickle', [level_hash(filename), cluster_size],
+                             lambda level: build_abstraction(level, cluster_size))
+
+
+def hpa_shortest_path(initial_position, destination, level, abstraction, adj=navigation_edges, stats=None):
+    """ Searches for a path through a level using its HPA* abstraction, then refines it into cells.
+
+    The path is found on the abstract graph, so it can be slightly more expensive than the one
+    dijkstras_shortest_path finds, in exchange for only ever searching a cluster at a time in the level itself.
+
+    Args:
+        initial_position: The initial cell from which the path extends.
+        destination: The end location for the path.
+        level: A loaded level, containing walls, spaces, and waypoints.
+        abstraction: The level's abstraction, as returned by build_abstraction or load_abstraction.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+        stats: An optional dictionary which receives the number of abstract nodes the search expanded under
+            'expanded'.
+
+    Returns:
+        If a path exits, return a list containing all cells from initial_position to destination.
+        Otherwise, return None.
+
+    """
+    # connect the endpoints to the nodes of their clusters, without touching the stored abstraction
+    extra = {}
+    extra_paths = {}
+    for cell, other_end in ((initial_position, destination), (destination, initial_position)):
+        cluster = cluster_of(abstraction, cell)
+        dist, prev = dijkstras_sweep(cell, level, cluster_edges(abstraction, cluster, adj))
+        for node in abstraction['nodes'].get(cluster, []) + [other_end]:
+            if node in dist and node != cell:
+                extra.setdefault(cell, []).append((node, dist[node]))
+                extra.setdefault(node, []).append((cell, dist[node]))
+                path = reconstruct_path(prev, node)
+                extra_paths[cell, node] = path
+                extra_paths[node, cell] = path[::-1]
+
+    def abstract_edges(level, node):
+        return abstraction['edges'].get(node, []) + extra.get(node, [])
+
+    route = dijkstras_shortest_path(initial_position, destination, level, abstract_edges, 'astar', stats=stats)
+    if not route:
+        return None
+
+    # refine each abstract edge into cells
+    path = [route[0]]
+    for a, b in zip(route, route[1:]):
+        if (a, b) in extra_paths:
+            path.extend(extra_paths[a, b][1:])
+        elif (a, b) in abstraction['paths']:
+            path.extend(decode_path(a, abstraction['paths'][a, b])[1:])
+        else:  # a transition across a border
+            path.append(b)
+    return path
+
+
+if __name__ == '__main__':
+    filename, src_waypoint, dst_waypoint = 'test_maze.txt', 'a', 'e'
+    level = load_level(filename)
+    abstraction = load_abstraction(filename)
+    path = hpa_shortest_path(level['waypoints'][src_waypoint], level['waypoints'][dst_waypoint], level, abstraction)
+    if path:
+        show_level(level, path)
+    else:
+        print("No path possible!")
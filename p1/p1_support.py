@@ -1,10 +1,21 @@
 # Support code for P1
 
+import pickle
+import struct
+from array import array
+from hashlib import sha1
 from math import inf
 from csv import writer
+from os.path import exists
+from sys import byteorder
 
 WALL = 'X'
 
+# binary cost maps start with this header (magic, width, height, x_lo, y_lo), followed by little-endian float32 costs
+# row by row
+COST_MAP_MAGIC = b'P1CM'
+COST_MAP_HEADER = struct.Struct('<4sIIii')
+
 
 def load_level(filename):
     """ Loads a level from a given text file.
@@ -41,6 +52,66 @@ def load_level(filename):
     return level
 
 
+def level_hash(filename):
+    """ Hashes the contents of a level file, so cached tables can tell when the level has changed. """
+    digest = sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_level_data(filename, suffix, key, build):
+    """ Loads data derived from a level file from its cache next to the level, building and caching it first if needed.
+
+    The data is stamped with key (under 'key') when it is cached, and rebuilt whenever the key it was cached with no
+    longer matches, so the key should hold the level_hash of the file and any settings the data was built with.
+
+    Args:
+        filename: The name of the text file containing the level.
+        suffix: What to add to filename to name the cache, such as '.waypoints.pickle'.
+        key: A list identifying the level and settings the data is built from.
+        build: A function building the data (a dict) from the loaded level.
+
+    Returns:
+        The data (dict), as returned by build.
+    """
+    cache_filename = filename + suffix
+
+    if exists(cache_filename):
+        with open(cache_filename, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('key') == key:
+            return data
+
+    data = build(load_level(filename))
+    data['key'] = key
+    with open(cache_filename, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return data
+
+
+def update_cell(level, cell, cost):
+    """ Changes the cost of a cell in a loaded level, turning it into a wall or a space as needed.
+
+    Args:
+        level: The level to be changed.
+        cell: The location of the cell.
+        cost: The new cost of the cell, or inf to turn it into a wall.
+
+    """
+    if cost == inf:
+        level['spaces'].pop(cell, None)
+        level['walls'].add(cell)
+    else:
+        level['walls'].discard(cell)
+        level['spaces'][cell] = float(cost)
+
+    # lets anything derived from the level tell that it is out of date
+    level['revision'] = level.get('revision', 0) + 1
+
+
 def show_level(level, path=[]):
     """ Displays a level via a print statement.
 
@@ -80,35 +151,38 @@ def show_level(level, path=[]):
 
 
 def save_level_costs(level, costs, filename='distance_map.csv'):
-    """ Displays cell costs from an origin point over the given level.
+    """ Saves cell costs from an origin point over the given level, one row of the level at a time.
+
+    Files ending in .csv are written as text, with inf for cells without a cost. Files ending in .p1cm are written in
+    the binary form read back by p1_grid.load_cost_map: a COST_MAP_HEADER followed by float32 costs.
 
     Args:
         level: The level to be displayed.
         costs: A dictionary containing a mapping of cells to costs from an origin point.
-        filename: The name of the csv file to be created.
+        filename: The name of the csv or p1cm file to be created.
 
     """
     xs, ys = zip(*(list(level['spaces'].keys()) + list(level['walls'])))
     x_lo, x_hi = min(xs), max(xs)
     y_lo, y_hi = min(ys), max(ys)
 
-    rows = []
-    for j in range(y_lo, y_hi + 1):
-        row = []
-
-        for i in range(x_lo, x_hi + 1):
-            cell = (i, j)
-            if cell not in costs:
-                row.append(inf)
-            else:
-                row.append(costs[cell])
-
-        rows.append(row)
-
-    assert '.csv' in filename, 'Error: filename does not contain file type.'
-    with open(filename, 'w', newline='') as f:
-        csv_writer = writer(f)
-        for row in rows:
-            csv_writer.writerow(row)
+    def rows():
+        for j in range(y_lo, y_hi + 1):
+            yield [costs.get((i, j), inf) for i in range(x_lo, x_hi + 1)]
+
+    if filename.endswith('.p1cm'):
+        with open(filename, 'wb') as f:
+            f.write(COST_MAP_HEADER.pack(COST_MAP_MAGIC, x_hi - x_lo + 1, y_hi - y_lo + 1, x_lo, y_lo))
+            for row in rows():
+                row = array('f', row)
+                if byteorder == 'big':
+                    row.byteswap()
+                row.tofile(f)
+    else:
+        assert '.csv' in filename, 'Error: filename does not contain file type.'
+        with open(filename, 'w', newline='') as f:
+            csv_writer = writer(f)
+            for row in rows():
+                csv_writer.writerow(row)
 
     print("Saved file:", filename)
@@ -0,0 +1,257 @@
+# Waypoint-to-waypoint distance tables for P1
+
+from math import inf
+
+from p1 import DIRECTIONS, dijkstras_sweep, reconstruct_path, navigation_edges
+from p1_support import cached_level_data, level_hash, load_level, show_level
+
+# the most waypoints a tour may visit before plan_tour switches from the exact search to 2-opt
+HELD_KARP_LIMIT = 12
+
+
+def encode_path(path):
+    """ Packs a path of adjacent cells into one byte per step (an index into DIRECTIONS). """
+    return bytes(DIRECTIONS.index((b[0] - a[0], b[1] - a[1])) for a, b in zip(path, path[1:]))
+
+
+def decode_path(origin, steps):
+    """ Unpacks a path packed by encode_path, starting from origin. """
+    path = [origin]
+    for step in steps:
+        dx, dy = DIRECTIONS[step]
+        path.append((path[-1][0] + dx, path[-1][1] + dy))
+    return path
+
+
+def build_waypoint_table(level, adj=navigation_edges):
+    """ Calculates the cost and path between every pair of waypoints with one sweep per waypoint.
+
+    Args:
+        level: A loaded level, containing walls, spaces, and waypoints.
+        adj: An adjacency function returning cells adjacent to a given cell as well as their respective edge costs.
+
+    Returns:
+        A table (dict) mapping each reachable pair of waypoint characters (in alphabetical order) to the cost of the
+        path between them, and to the path itself packed by encode_path.
+    """
+    waypoints = level['waypoints']
+    names = sorted(waypoints)
+    dists = {}
+    paths = {}
+
+    for i, src in enumerate(names):
+        dist, prev = dijkstras_sweep(waypoints[src], level, adj)
+        for dst in names[i + 1:]:
+            if waypoints[dst] in dist:
+                dists[src, dst] = dist[waypoints[dst]]
+                paths[src, dst] = encode_path(reconstruct_path(prev, waypoints[dst]))
+
+    return {'waypoints': dict(waypoints), 'dists': dists, 'paths': paths}
+
+
+def load_waypoint_table(filename):
+    """ Loads the waypoint table for a level file, building and caching it first if needed.
+
+    The table is cached next to the level as filename + '.waypoints.pickle' (see cached_level_data).
+
+    Args:
+        filename: The name of the text file containing the level.
+
+    Returns:
+        The waypoint table (dict) as built by build_waypoint_table.
+    """
+    return cached_level_data(filename, '.waypoints.pickle', [level_hash(filename)], build_waypoint_table)
+
+
+def waypoint_route(table, src_waypoint, dst_waypoint):
+    """ Looks up the cheapest route between two waypoints in a waypoint table.
+
+    Args:
+        table: A waypoint table, as returned by load_waypoint_table.
+        src_waypoint: The character associated with the initial waypoint.
+        dst_waypoint: The character associated with the destination waypoint.
+
+    Returns:
+        The cost of the route and a list containing all cells from the initial to the destination waypoint, or
+        (inf, None) if the waypoints are not connected.
+    """
+    waypoints = table['waypoints']
+    if src_waypoint == dst_waypoint:
+        return 0, [waypoints[src_waypoint]]
+
+    key = tuple(sorted((src_waypoint, dst_waypoint)))
+    if key not in table['dists']:
+        return inf, None
+
+    path = decode_path(waypoints[key[0]], table['paths'][key])
+    if key[0] != src_waypoint:
+        path.reverse()
+    return table['dists'][key], path
+
+
+def waypoint_route_cost(table, src_waypoint, dst_waypoint):
+    """ Looks up the cost of the cheapest route between two waypoints, or inf if they are not connected. """
+    if src_waypoint == dst_waypoint:
+        return 0
+    return table['dists'].get(tuple(sorted((src_waypoint, dst_waypoint))), inf)
+
+
+def held_karp(count, cost, closed=False):
+    """ Finds the cheapest order to visit points 1 to count - 1, starting from point 0, by dynamic programming over
+    subsets of the points (Held-Karp), in O(2^count * count^2) time.
+
+    Args:
+        count: The number of points.
+        cost: A function giving the cost of travelling between two points.
+        closed: Whether the tour has to return to point 0 at the end.
+
+    Returns:
+        The cost of the tour and the order of the points along it.
+    """
+    if count == 1:
+        return 0, [0]
+
+    # best[mask][j]: the cheapest way from 0 through the points in mask (bit i - 1 for point i), ending at j
+    full = (1 << (count - 1)) - 1
+    best = [[inf] * count for _ in range(full + 1)]
+    prev = [[None] * count for _ in range(full + 1)]
+    for j in range(1, count):
+        best[1 << (j - 1)][j] = cost(0, j)
+
+    for mask in range(1, full + 1):
+        for j in range(1, count):
+            if best[mask][j] == inf:
+                continue
+            for k in range(1, count):
+                bit = 1 << (k - 1)
+                if not mask & bit and best[mask][j] + cost(j, k) < best[mask | bit][k]:
+                    best[mask | bit][k] = best[mask][j] + cost(j, k)
+                    prev[mask | bit][k] = j
+
+    total, last = min((best[full][j] + (cost(j, 0) if closed else 0), j) for j in range(1, count))
+    order = []
+    mask = full
+    while last is not None:  # backpathing
+        order.append(last)
+        mask, last = mask & ~(1 << (last - 1)), prev[mask][last]
+    order.append(0)
+    order.reverse()
+    return total, order
+
+
+def two_opt(count, cost, closed=False):
+    """ Approximates the cheapest order to visit points 1 to count - 1, starting from point 0, by taking the nearest
+    unvisited point each time, then reversing stretches of the tour for as long as that makes it cheaper (2-opt).
+
+    Args:
+        count: The number of points.
+        cost: A function giving the cost of travelling between two points.
+        closed: Whether the tour has to return to point 0 at the end.
+
+    Returns:
+        The cost of the tour and the order of the points along it.
+    """
+    order = [0]
+    left = set(range(1, count))
+    while left:
+        nearest = min(left, key=lambda k: (cost(order[-1], k), k))
+        order.append(nearest)
+        left.remove(nearest)
+
+    def after(j):
+        # the point following position j, if any
+        if j + 1 < count:
+            return order[j + 1]
+        return order[0] if closed else None
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, count - 1):
+            for j in range(i + 1, count):
+                # reversing order[i:j + 1] swaps edges (i - 1, i) and (j, j + 1) for (i - 1, j) and (i, j + 1)
+                a, b, c, d = order[i - 1], order[i], order[j], after(j)
+                before, now = cost(a, b), cost(a, c)
+                if d is not None:
+                    before, now = before + cost(c, d), now + cost(b, d)
+                if now < before - 1e-9:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+
+    total = sum(cost(a, b) for a, b in zip(order, order[1:]))
+    if closed:
+        total += cost(order[-1], 0)
+    return total, order
+
+
+def plan_tour(table, names, closed=False):
+    """ Plans the cheapest route from the first of the given waypoints through all the others, in any order.
+
+    Costs between waypoints come from the waypoint table, so no further searching is needed. The order is exact for
+    up to HELD_KARP_LIMIT waypoints, and approximated by two_opt beyond that.
+
+    Args:
+        table: A waypoint table, as returned by build_waypoint_table or load_waypoint_table.
+        names: The characters of the waypoints to visit, starting with the one the route sets off from.
+        closed: Whether the route has to return to the first waypoint at the end.
+
+    Returns:
+        The cost of the route, the order the waypoints are visited in, and a list containing all cells along the
+        route, or (inf, None, None) if some waypoint cannot be reached.
+    """
+    names = list(dict.fromkeys(names))  # drop repeats, keeping the first waypoint first
+
+    def cost(i, j):
+        return waypoint_route_cost(table, names[i], names[j])
+
+    solve = held_karp if len(names) <= HELD_KARP_LIMIT else two_opt
+    total, order = solve(len(names), cost, closed)
+    if total == inf:
+        return inf, None, None
+
+    stops = [names[i] for i in order] + ([names[0]] if closed and len(names) > 1 else [])
+    path = [table['waypoints'][stops[0]]]
+    for src, dst in zip(stops, stops[1:]):
+        path.extend(waypoint_route(table, src, dst)[1][1:])
+    return total, stops, path
+
+
+def test_cached_route(filename, src_waypoint, dst_waypoint):
+    """ Loads the waypoint table for a level and displays the cached route between the given waypoints.
+
+    Args:
+        filename: The name of the text file containing the level.
+        src_waypoint: The character associated with the initial waypoint.
+        dst_waypoint: The character associated with the destination waypoint.
+
+    """
+    table = load_waypoint_table(filename)
+    cost, path = waypoint_route(table, src_waypoint, dst_waypoint)
+    if path:
+        show_level(load_level(filename), path)
+        print("Route cost:", cost)
+    else:
+        print("No path possible!")
+
+
+def test_tour(filename, names, closed=False):
+    """ Loads the waypoint table for a level and displays the cheapest tour through the given waypoints.
+
+    Args:
+        filename: The name of the text file containing the level.
+        names: The characters of the waypoints to visit, starting with the one the tour sets off from.
+        closed: Whether the tour has to return to the first waypoint at the end.
+
+    """
+    cost, stops, path = plan_tour(load_waypoint_table(filename), names, closed)
+    if path:
+        show_level(load_level(filename), path)
+        print("Tour:", ' -> '.join(stops))
+        print("Tour cost:", cost)
+    else:
+        print("No tour possible!")
+
+
+if __name__ == '__main__':
+    test_cached_route('example.txt', 'a', 'e')
+    test_tour('example.txt', 'abce')
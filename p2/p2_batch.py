@@ -0,0 +1,106 @@
+# Headless batch route queries against a P2 navmesh
+
+import io
+import json
+import sys
+from contextlib import redirect_stdout
+from math import isfinite
+from timeit import default_timer as time
+
+import p2_pathfinder
+from p2_mesh import load_mesh
+
+
+def parse_query(line):
+    """ Reads a query line of the form "x1 y1 x2 y2" into its source and destination points, or None for blank lines
+    and comments (starting with #). Raises ValueError for malformed lines. """
+    line = line.split('#', 1)[0].strip()
+    if not line:
+        return None
+    values = line.split()
+    if len(values) != 4:
+        raise ValueError("queries need four coordinates, got %d" % len(values))
+    values = [float(v) for v in values]
+    if not all(isfinite(v) for v in values):
+        raise ValueError("coordinates must be finite numbers")
+    values = [int(v) if v.is_integer() else v for v in values]
+    return tuple(values[:2]), tuple(values[2:])
+
+
+def percentile(values, fraction):
+    """ Picks the value a given fraction of the way through a sorted list (nearest rank). """
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def run_queries(mesh, lines, output=sys.stdout, find_path=p2_pathfinder.find_path):
+    """ Answers route queries against a mesh, writing one JSON line per query as it goes.
+
+    Malformed query lines are reported by a JSON line holding their line number and an error, and skipped.
+
+    Args:
+        mesh: A mesh, as loaded by p2_mesh.load_mesh.
+        lines: An iterable of query lines, as read by parse_query.
+        output: The stream the JSON lines are written to.
+        find_path: The function answering each query, such as p2_pathfinder.find_path or RouteCache.find_path.
+
+    Returns:
+        A list of the seconds each query took.
+    """
+    latencies = []
+    for number, line in enumerate(lines, 1):
+        try:
+            query = parse_query(line)
+        except ValueError as error:
+            output.write(json.dumps({'line': number, 'error': str(error)}) + '\n')
+            continue
+        if query is None:
+            continue
+        source, destination = query
+
+        with redirect_stdout(io.StringIO()):  # keep find_path's "No path!" out of the output
+            start = time()
+            path, visited = find_path(source, destination, mesh)
+            path, visited = list(path), list(visited)
+            seconds = time() - start
+
+        latencies.append(seconds)
+        output.write(json.dumps({'source': source, 'destination': destination, 'path': path,
+                                 'visited': len(visited), 'seconds': seconds}) + '\n')
+    return latencies
+
+
+def summarize(latencies, elapsed):
+    """ Describes the throughput and latency of a batch of queries in one line. """
+    if not latencies:
+        return "No queries."
+    latencies = sorted(latencies)
+    return "%d queries in %.3fs: %.1f queries/sec, p50 %.3fms, p99 %.3fms" % (
+        len(latencies), elapsed, len(latencies) / elapsed, percentile(latencies, .5) * 1000,
+        percentile(latencies, .99) * 1000)
+
+
+if __name__ == '__main__':
+
+    if not 2 <= len(sys.argv) <= 4:
+        print("usage: %s mesh_file [queries_file|-] [cache_capacity]" % sys.argv[0])
+        sys.exit(-1)
+
+    mesh = load_mesh(sys.argv[1])
+    queries_filename = sys.argv[2] if len(sys.argv) > 2 else '-'
+    capacity = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    cache = p2_pathfinder.RouteCache(capacity) if capacity else None
+    find_path = cache.find_path if cache else p2_pathfinder.find_path
+
+    start = time()
+    if queries_filename == '-':
+        latencies = run_queries(mesh, sys.stdin, find_path=find_path)
+    else:
+        with open(queries_filename, 'r') as f:
+            latencies = run_queries(mesh, f, find_path=find_path)
+    elapsed = time() - start
+
+    # the summary goes to stderr, so stdout stays pure JSON lines
+    print(summarize(latencies, elapsed), file=sys.stderr)
+    if cache:
+        print("Route cache: %d hits, %d misses" % (cache.hits, cache.misses), file=sys.stderr)
@@ -0,0 +1,152 @@
+# Benchmark of p2_pathfinder.find_path against the original implementation
+
+import io
+import pickle
+import random
+import sys
+from contextlib import redirect_stdout
+from heapq import heapify, heappush
+from math import inf
+from timeit import default_timer as time
+
+import p2_pathfinder
+
+MESH_FILENAMES = ('homer.png.mesh.pickle', 'ucsc_banana_slug.png.mesh.pickle')
+
+
+def legacy_find_path(source_point, destination_point, mesh):
+    """
+    The original find_path, kept as the reference the current one is timed against: it locates boxes by scanning
+    every box, and picks each node to expand by scanning the whole open set
+
+    Args:
+        source_point: starting point of the pathfinder
+        destination_point: the ultimate goal the pathfinder must reach
+        mesh: pathway constraints the path adheres to
+
+    Returns:
+
+        A path (list of points) from source_point to destination_point if exists
+        A list of boxes explored by the algorithm
+    """
+
+    def find_box(point):
+        return next((box for box in mesh["boxes"] if point[0] >= box[0] and point[0] < box[1] and point[1] >= box[2] and point[1] < box[3]), None)
+    start = find_box(source_point)
+    end = find_box(destination_point)
+    if not start or not end:
+        print("No path!")
+        return [], []
+    if start == end:
+        return [(source_point, destination_point)], [start]
+
+    grid = {}
+
+    def Node(bounds, h=0, g=inf, f=inf, prev=None, head=True):
+        grid[bounds] = {"h": h, "g": g, "f": f, "prev": prev, "head": head}
+        return bounds
+
+    def centre(b):
+        return ((b[0]+b[1])/2, (b[2]+b[3])/2)
+
+    def dist(a, b):
+        return (lambda c, d: ((d[0]-c[0])**2+(d[1]-c[1])**2)**.5)(centre(a), centre(b))
+
+    def tuplify(boxes):
+        def clamp(a, b):
+            def c(i):
+                return max(min(max(a[i], b[i]), centre(a)[i]), min(a[i+1], b[i+1]))
+            return (c(0), c(1))
+        centres = [destination_point] + (lambda B: [clamp(b, B[i+1])
+                                                    for i, b in enumerate(B[:-1])])(boxes[1:-1]) + [source_point]
+        return zip(centres[1:], centres[:-1])
+
+    Node(start, g=0)
+    Node(end, head=False)
+
+    open_set = [start]
+    path = []
+
+    while open_set:
+        # get node with min f
+        current = min(open_set, key=lambda n: grid[n]["f"])
+        if(current == end):  # if at goal
+            back = current
+            while back:
+                path.append(back)
+                back = grid[back]["prev"]
+            return tuplify(path), grid.keys()
+
+        open_set.remove(current)
+        heapify(open_set)
+        for neighbour in mesh["adj"][current]:  # check each neighbour
+            temp_g = grid[current]["g"] + dist(current, neighbour)
+            # check predicted dist
+            if neighbour not in grid.keys() or temp_g < grid[neighbour]["g"]:
+                Node(neighbour, g=temp_g, f=temp_g +
+                     dist(neighbour, end if grid[current]["head"] else start), prev=current, head=grid[current]["head"])
+                if neighbour not in open_set:
+                    heappush(open_set, neighbour)
+    print("No path!")
+
+    return [], grid.keys()
+
+
+def random_queries(mesh, count, seed=0):
+    """ Picks random (source, destination) pairs of points, each inside some box of the mesh. """
+    rng = random.Random(seed)
+
+    def point():
+        x1, x2, y1, y2 = rng.choice(mesh['boxes'])
+        return rng.randrange(int(x1), int(x2)) if x2 - x1 >= 1 else x1, \
+            rng.randrange(int(y1), int(y2)) if y2 - y1 >= 1 else y1
+
+    return [(point(), point()) for _ in range(count)]
+
+
+def time_queries(find_path, mesh, queries):
+    """ Runs every query through a find_path function, returning the total seconds taken and the results. """
+    results = []
+    with redirect_stdout(io.StringIO()):  # hide the "No path!" messages
+        start = time()
+        for source, destination in queries:
+            path, visited = find_path(source, destination, mesh)
+            results.append((list(path), list(visited)))
+        seconds = time() - start
+    return seconds, results
+
+
+def compare(filename, count=200, seed=0):
+    """ Times the original and the current find_path over the same random queries on a mesh and prints the results.
+
+    Args:
+        filename: The name of the mesh pickle.
+        count: The number of queries.
+        seed: The seed the queries are picked with.
+
+    """
+    with open(filename, 'rb') as f:
+        mesh = pickle.load(f)
+    queries = random_queries(mesh, count, seed)
+
+    legacy_seconds, legacy_results = time_queries(legacy_find_path, mesh, queries)
+    with open(filename, 'rb') as f:
+        mesh = pickle.load(f)  # a fresh copy, so the timing includes building the mesh's index and centres
+    seconds, results = time_queries(p2_pathfinder.find_path, mesh, queries)
+
+    same = sum(old[0] == new[0] for old, new in zip(legacy_results, results))
+    print("%s: %d queries, original %.2fms/query, current %.2fms/query (%.1fx), %d identical paths" % (
+        filename, count, legacy_seconds / count * 1000, seconds / count * 1000, legacy_seconds / seconds, same))
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 3:
+        print("usage: %s [queries] [seed]" % sys.argv[0])
+        sys.exit(-1)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    for filename in MESH_FILENAMES:
+        compare(filename, count, seed)
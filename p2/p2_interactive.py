@@ -1,20 +1,19 @@
 import sys
 import random
-import pickle
 import traceback
 import tkinter
 
 import p2_pathfinder
+from p2_mesh import load_mesh
 
 if len(sys.argv) != 4:
-    print("usage: %s map.gif map.mesh.pickle subsample_factor" % sys.argv[0])
+    print("usage: %s map.gif map.mesh.pickle|map.mesh.npy subsample_factor" % sys.argv[0])
     sys.exit(-1)
 
 _, MAP_FILENAME, MESH_FILENAME, SUBSAMPLE = sys.argv
 SUBSAMPLE = int(SUBSAMPLE)
 
-with open(MESH_FILENAME, 'rb') as f:
-  mesh = pickle.load(f)
+mesh = load_mesh(MESH_FILENAME)
 
 master = tkinter.Tk()
 
@@ -0,0 +1,252 @@
+# Shared helpers for P2 navmeshes
+
+import pickle
+import sys
+from math import ceil, floor, isfinite, sqrt
+
+import numpy
+
+# the fields at the start of a compact mesh file, before its arrays
+COMPACT_HEADER = ('boxes', 'targets', 'size', 'rows', 'columns', 'members')
+
+
+def build_index(boxes):
+    """ Buckets the boxes of a mesh into a uniform grid, so the box holding a point can be found in O(1).
+
+    Buckets are square and sized so there is about one box per bucket on average; every box is listed in each bucket
+    it overlaps.
+
+    Args:
+        boxes: The (x1, x2, y1, y2) boxes of the mesh.
+
+    Returns:
+        The index (dict), holding the bucket size, the number of bucket rows and columns, and the buckets in
+        compressed-sparse-row form: the positions in boxes of the members of bucket b (row-major) are
+        members[offsets[b]:offsets[b + 1]].
+    """
+    if not len(boxes):
+        return {'size': 1, 'rows': 0, 'columns': 0, 'offsets': [0], 'members': []}
+
+    x_hi = max(box[1] for box in boxes)
+    y_hi = max(box[3] for box in boxes)
+    size = max(1, int(sqrt(x_hi * y_hi / len(boxes))))
+    rows, columns = int(ceil(x_hi / size)), int(ceil(y_hi / size))
+
+    buckets = [[] for _ in range(rows * columns)]
+    for position, (x1, x2, y1, y2) in enumerate(boxes):
+        for i in range(int(floor(x1 / size)), min(rows, int(ceil(x2 / size)))):
+            for j in range(int(floor(y1 / size)), min(columns, int(ceil(y2 / size)))):
+                buckets[i * columns + j].append(position)
+
+    offsets = [0]
+    members = []
+    for bucket in buckets:
+        members.extend(bucket)
+        offsets.append(len(members))
+
+    return {'size': size, 'rows': rows, 'columns': columns, 'offsets': offsets, 'members': members}
+
+
+def mesh_index(mesh):
+    """ Returns the spatial index of a mesh, building it (and keeping it in the mesh) for meshes saved without one. """
+    if 'index' not in mesh:
+        mesh['index'] = build_index(mesh['boxes'])
+    return mesh['index']
+
+
+def is_compact(mesh):
+    """ Tells whether a mesh is in the compact form of compact_mesh, rather than as built by build_mesh. """
+    return 'offsets' in mesh
+
+
+def mesh_centres(mesh):
+    """ Returns the centre of every box of a mesh, working them out once (and keeping them in the mesh).
+
+    The centres are a dictionary keyed by box, or for compact meshes a list indexed by box number.
+    """
+    if 'centres' not in mesh:
+        if is_compact(mesh):
+            boxes = numpy.asarray(mesh['boxes'], dtype=numpy.float64)
+            mesh['centres'] = list(zip(((boxes[:, 0] + boxes[:, 1]) / 2).tolist(),
+                                       ((boxes[:, 2] + boxes[:, 3]) / 2).tolist()))
+        else:
+            mesh['centres'] = {box: ((box[0] + box[1]) / 2, (box[2] + box[3]) / 2) for box in mesh['boxes']}
+    return mesh['centres']
+
+
+def portal_point(a, b, centre):
+    """ Picks the point find_path's paths pass through on the portal between box a and box b, given a's centre. """
+    def c(i):
+        return max(min(max(a[i], b[i]), centre[i]), min(a[i+1], b[i+1]))
+    return (c(0), c(1))
+
+
+def portal_table(mesh):
+    """ Works out, for every edge of a mesh, everything find_path needs to know about crossing it.
+
+    Args:
+        mesh: A mesh, as built by p2_meshbuilder.build_mesh or loaded by load_mesh.
+
+    Returns:
+        For meshes as built by build_mesh, a dictionary mapping each box a to a list, in the order of mesh['adj'][a],
+        of (b, cost, point, portal) tuples: the neighbouring box, the distance between the centres of a and b, the
+        portal_point of b coming from a, and the portal itself as its ((x, y), (x, y)) corners.
+        For compact meshes, the same as arrays in the order of mesh['targets']: 'costs' (m), 'points' (m, 2) and
+        'portals' (m, 4, as x_lo, y_lo, x_hi, y_hi).
+    """
+    centres = mesh_centres(mesh)
+
+    if not is_compact(mesh):
+        def edge(a, b):
+            (x1, y1), (x2, y2) = centres[a], centres[b]
+            portal = ((max(a[0], b[0]), max(a[2], b[2])), (min(a[1], b[1]), min(a[3], b[3])))
+            return b, ((x2-x1)**2+(y2-y1)**2)**.5, portal_point(b, a, centres[b]), portal
+
+        return {a: [edge(a, b) for b in neighbours] for a, neighbours in mesh['adj'].items()}
+
+    # the same sums, a whole array of edges at a time
+    sources = numpy.repeat(numpy.arange(len(mesh['boxes'])), numpy.diff(mesh['offsets']))
+    a = numpy.asarray(mesh['boxes'], dtype=numpy.float64)[sources]
+    b = numpy.asarray(mesh['boxes'], dtype=numpy.float64)[mesh['targets']]
+    centre_a, centre_b = numpy.array(centres)[sources], numpy.array(centres)[mesh['targets']]
+
+    def c(i):
+        return numpy.maximum(numpy.minimum(numpy.maximum(b[:, i], a[:, i]), centre_b[:, i]),
+                             numpy.minimum(b[:, i+1], a[:, i+1]))
+
+    return {'costs': ((centre_b - centre_a)**2).sum(axis=1)**.5,
+            'points': numpy.stack([c(0), c(1)], axis=1),
+            'portals': numpy.stack([numpy.maximum(a[:, 0], b[:, 0]), numpy.maximum(a[:, 2], b[:, 2]),
+                                    numpy.minimum(a[:, 1], b[:, 1]), numpy.minimum(a[:, 3], b[:, 3])], axis=1)}
+
+
+def mesh_portals(mesh):
+    """ Returns the portal table of a mesh, building it (and keeping it in the mesh) for meshes saved without one. """
+    if 'portals' not in mesh:
+        mesh['portals'] = portal_table(mesh)
+    return mesh['portals']
+
+
+def locate(mesh, point):
+    """ Finds the position in mesh['boxes'] of the box which holds a point, or None if it lies outside every box. """
+    if not (isfinite(point[0]) and isfinite(point[1])):  # inf and nan lie in no box, and have no bucket
+        return None
+    index = mesh_index(mesh)
+    i, j = int(floor(point[0] / index['size'])), int(floor(point[1] / index['size']))
+    if not (0 <= i < index['rows'] and 0 <= j < index['columns']):
+        return None
+
+    bucket = i * index['columns'] + j
+    for position in index['members'][index['offsets'][bucket]:index['offsets'][bucket + 1]]:
+        x1, x2, y1, y2 = mesh['boxes'][position]
+        if x1 <= point[0] < x2 and y1 <= point[1] < y2:
+            return int(position)
+    return None
+
+
+def find_box(mesh, point):
+    """ Finds the box of a mesh which holds a point.
+
+    Args:
+        mesh: A mesh, as built by p2_meshbuilder.build_mesh or loaded by load_mesh.
+        point: The (x, y) point to look up.
+
+    Returns:
+        The (x1, x2, y1, y2) box holding the point, or None if it lies outside every box.
+    """
+    position = locate(mesh, point)
+    if position is None:
+        return None
+    return tuple(int(v) for v in mesh['boxes'][position]) if is_compact(mesh) else mesh['boxes'][position]
+
+
+def compact_mesh(mesh):
+    """ Converts a mesh as built by build_mesh into compact form, where boxes are numbered by their position in
+    mesh['boxes'] and everything is held in int32 arrays.
+
+    Args:
+        mesh: A mesh, as built by p2_meshbuilder.build_mesh, with integer box coordinates.
+
+    Returns:
+        The compact mesh (dict), holding an (n, 4) array of boxes, the adjacency in compressed-sparse-row form (the
+        neighbours of box i are targets[offsets[i]:offsets[i + 1]]), and the spatial index.
+    """
+    assert all(float(v).is_integer() for box in mesh['boxes'] for v in box), \
+        'Error: compact meshes need integer box coordinates.'
+
+    number = {box: i for i, box in enumerate(mesh['boxes'])}
+    offsets = [0]
+    targets = []
+    for box in mesh['boxes']:
+        targets.extend(number[neighbour] for neighbour in mesh['adj'][box])
+        offsets.append(len(targets))
+
+    index = mesh_index(mesh)
+    return {'boxes': numpy.array(mesh['boxes'], dtype=numpy.int32).reshape(-1, 4),
+            'offsets': numpy.array(offsets, dtype=numpy.int32),
+            'targets': numpy.array(targets, dtype=numpy.int32),
+            'index': {'size': index['size'], 'rows': index['rows'], 'columns': index['columns'],
+                      'offsets': numpy.array(index['offsets'], dtype=numpy.int32),
+                      'members': numpy.array(index['members'], dtype=numpy.int32)}}
+
+
+def save_compact_mesh(mesh, filename):
+    """ Saves a mesh in compact form as a single int32 .npy file: the COMPACT_HEADER fields, then the boxes, the
+    adjacency offsets and targets, and the index offsets and members.
+
+    Args:
+        mesh: A mesh, either as built by build_mesh or already compact.
+        filename: The name of the .npy file to be created.
+
+    """
+    if not is_compact(mesh):
+        mesh = compact_mesh(mesh)
+    index = mesh['index']
+    header = [len(mesh['boxes']), len(mesh['targets']), index['size'], index['rows'], index['columns'],
+              len(index['members'])]
+    numpy.save(filename, numpy.concatenate([numpy.array(header, dtype=numpy.int32), mesh['boxes'].reshape(-1),
+                                            mesh['offsets'], mesh['targets'], index['offsets'], index['members']]))
+
+
+def load_compact_mesh(filename):
+    """ Loads a mesh saved by save_compact_mesh, memory-mapping the file rather than reading it in.
+
+    Returns:
+        The compact mesh (dict), as returned by compact_mesh, whose arrays are read-only views of the file.
+    """
+    data = numpy.load(filename, mmap_mode='r')
+    header = dict(zip(COMPACT_HEADER, (int(v) for v in data[:len(COMPACT_HEADER)])))
+
+    def take(count):
+        nonlocal start
+        start += count
+        return data[start - count:start]
+
+    start = len(COMPACT_HEADER)
+    boxes = take(4 * header['boxes']).reshape(-1, 4)
+    offsets = take(header['boxes'] + 1)
+    targets = take(header['targets'])
+    index = {'size': header['size'], 'rows': header['rows'], 'columns': header['columns'],
+             'offsets': take(header['rows'] * header['columns'] + 1), 'members': take(header['members'])}
+    return {'boxes': boxes, 'offsets': offsets, 'targets': targets, 'index': index}
+
+
+def load_mesh(filename):
+    """ Loads a mesh from either a compact .npy file or a pickle written by p2_meshbuilder. """
+    if filename.endswith('.npy'):
+        return load_compact_mesh(filename)
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 2:
+        print("usage: %s mesh_pickle" % sys.argv[0])
+        sys.exit(-1)
+
+    filename = sys.argv[1]
+    compact_filename = (filename[:-len('.pickle')] if filename.endswith('.pickle') else filename) + '.npy'
+    save_compact_mesh(load_mesh(filename), compact_filename)
+
+    print("Saved file:", compact_filename)
@@ -2,118 +2,261 @@ import collections
 import pickle
 import sys
 import random
+from multiprocessing import Pool, cpu_count
 
 from matplotlib.pyplot import imread, imsave
 import numpy
 from numpy import zeros_like
 
+from p2_mesh import build_index, portal_table, save_compact_mesh
 
-def build_mesh(image, min_feature_size):
-    def scan(box):
 
-        x1, x2, y1, y2 = box
-        area = (x2 - x1) * (y2 - y1)
+def summed_area_table(mask):
+    """ Builds a summed-area table of a boolean image, so the number of set pixels in any box takes four lookups.
 
-        if area < min_feature_size or (image[x1:x2, y1:y2] == 255).all() or (image[x1:x2, y1:y2] == 0).all():
+    Args:
+        mask: A 2D boolean array.
 
-            # this box is simple enough to handle in one node
-            if (image[x1:x2, y1:y2] == 255).all():
-                return [box], []
-            else:
-                return [], []
+    Returns:
+        An integer array one larger than mask in each dimension, where entry [i, j] counts the set pixels of
+        mask[:i, :j].
+    """
+    table = numpy.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=numpy.int64)
+    numpy.cumsum(mask, axis=1, out=table[1:, 1:])
+    numpy.cumsum(table, axis=0, out=table)  # down the rows last, which numpy does a whole row at a time
+    return table
+
+
+def box_sum(table, box):
+    """ Counts the set pixels in an (x1, x2, y1, y2) box of the image a summed-area table was built from. """
+    x1, x2, y1, y2 = box
+    return int(table[x2, y2] - table[x1, y2] - table[x2, y1] + table[x1, y1])
 
-        else:
 
-            # recursively split this big box on the longest dimension
-            if x2 - x1 > y2 - y1:
+def split_box(box):
+    """ Splits a box in two across its longest dimension.
 
-                cut = x1 + (x2 - x1) / 2 + 1
-                first_box = (x1, cut, y1, y2)
-                second_box = (cut, x2, y1, y2)
+    Returns:
+        The two halves, and functions giving the rank of a box along the cut and telling whether a box in the first
+        or second half touches the cut.
+    """
+    x1, x2, y1, y2 = box
 
-                def rank(b): return (b[2], b[3])
+    if x2 - x1 > y2 - y1:
 
-                def first_touch(b): return b[1] == cut
+        cut = x1 + (x2 - x1) // 2 + 1
+        first_box = (x1, cut, y1, y2)
+        second_box = (cut, x2, y1, y2)
 
-                def second_touch(b): return b[0] == cut
+        def rank(b): return (b[2], b[3])
 
-            else:
+        def first_touch(b): return b[1] == cut
 
-                cut = y1 + (y2 - y1) / 2 + 1
-                first_box = (x1, x2, y1, cut)
-                second_box = (x1, x2, cut, y2)
+        def second_touch(b): return b[0] == cut
 
-                def rank(b): return (b[0], b[1])
+    else:
+
+        cut = y1 + (y2 - y1) // 2 + 1
+        first_box = (x1, x2, y1, cut)
+        second_box = (x1, x2, cut, y2)
+
+        def rank(b): return (b[0], b[1])
 
-                def first_touch(b): return b[3] == cut
+        def first_touch(b): return b[3] == cut
 
-                def second_touch(b): return b[2] == cut
+        def second_touch(b): return b[2] == cut
 
-            first_boxes, first_edges = scan(first_box)
-            second_boxes, second_edges = scan(second_box)
+    return first_box, second_box, rank, first_touch, second_touch
 
-            my_boxes = []
-            my_edges = []
 
-            my_boxes.extend([fb for fb in first_boxes if not first_touch(fb)])
-            my_boxes.extend(
-                [sb for sb in second_boxes if not second_touch(sb)])
+def merge_halves(box, first, second):
+    """ Joins the meshes of the two halves of a box (as split by split_box) into the mesh of the whole box.
 
-            first_touches = sorted(filter(first_touch, first_boxes), key=rank)
-            second_touches = sorted(
-                filter(second_touch, second_boxes), key=rank)
+    Boxes facing each other exactly across the cut are merged into one, and boxes which overlap across it are joined
+    by an edge.
 
-            first_merges = {}
-            second_merges = {}
+    Args:
+        box: The box that was split.
+        first: The (boxes, edges) of the first half.
+        second: The (boxes, edges) of the second half.
 
-            while first_touches and second_touches:
+    Returns:
+        The boxes and edges of the whole box.
+    """
+    _, _, rank, first_touch, second_touch = split_box(box)
+    first_boxes, first_edges = first
+    second_boxes, second_edges = second
 
-                f, s = first_touches[0], second_touches[0]
-                rf, rs = rank(f), rank(s)
+    my_boxes = []
+    my_edges = []
 
-                if rf == rs:
+    my_boxes.extend([fb for fb in first_boxes if not first_touch(fb)])
+    my_boxes.extend(
+        [sb for sb in second_boxes if not second_touch(sb)])
 
-                    first_touches.pop(0)
-                    second_touches.pop(0)
-                    merged = (f[0], s[1], f[2], s[3])
-                    first_merges[f] = merged
-                    second_merges[s] = merged
-                    my_boxes.append(merged)
+    first_touches = collections.deque(sorted(filter(first_touch, first_boxes), key=rank))
+    second_touches = collections.deque(sorted(
+        filter(second_touch, second_boxes), key=rank))
 
-                elif rf[1] < rs[1]:
+    first_merges = {}
+    second_merges = {}
 
-                    my_boxes.append(first_touches.pop(0))
-                    if rf[1] >= rs[0]:
-                        my_edges.append((f, s))
+    while first_touches and second_touches:
 
-                elif rf[1] > rs[1]:
+        f, s = first_touches[0], second_touches[0]
+        rf, rs = rank(f), rank(s)
 
-                    my_boxes.append(second_touches.pop(0))
-                    if rf[0] <= rs[1]:
-                        my_edges.append((f, s))
+        if rf == rs:
 
-                else:
+            first_touches.popleft()
+            second_touches.popleft()
+            merged = (f[0], s[1], f[2], s[3])
+            first_merges[f] = merged
+            second_merges[s] = merged
+            my_boxes.append(merged)
 
-                    my_boxes.append(first_touches.pop(0))
-                    my_boxes.append(second_touches.pop(0))
-                    my_edges.append((f, s))
+        elif rf[1] < rs[1]:
 
-            my_boxes.extend(first_touches)
-            my_boxes.extend(second_touches)
+            my_boxes.append(first_touches.popleft())
+            if rf[1] >= rs[0]:
+                my_edges.append((f, s))
 
-            for a, b in first_edges:
-                my_edges.append(
-                    (first_merges.get(a, a), first_merges.get(b, b)))
+        elif rf[1] > rs[1]:
+
+            my_boxes.append(second_touches.popleft())
+            if rf[0] <= rs[1]:
+                my_edges.append((f, s))
+
+        else:
 
-            for a, b in second_edges:
-                my_edges.append(
-                    (second_merges.get(a, a), second_merges.get(b, b)))
+            my_boxes.append(first_touches.popleft())
+            my_boxes.append(second_touches.popleft())
+            my_edges.append((f, s))
 
-            return my_boxes, my_edges
+    my_boxes.extend(first_touches)
+    my_boxes.extend(second_touches)
 
-            # end of scan
+    for a, b in first_edges:
+        my_edges.append(
+            (first_merges.get(a, a), first_merges.get(b, b)))
 
-    boxes, edges = scan((0, image.shape[0], 0, image.shape[1]))
+    for a, b in second_edges:
+        my_edges.append(
+            (second_merges.get(a, a), second_merges.get(b, b)))
+
+    return my_boxes, my_edges
+
+
+def scan(image, box, min_feature_size, white=None, black=None, tile_depth=None, tiles=None):
+    """ Covers the white pixels of a box of the image with boxes, splitting it in halves until each part is simple.
+
+    A part is simple once it is all white (and kept), all black (and dropped), or smaller than min_feature_size (and
+    kept only if all white). Parts are handled depth first, first half before second, with an explicit stack rather
+    than recursion, and whether a part is uniform is read off summed-area tables of the image's white and black
+    pixels rather than by scanning its pixels.
+
+    With tile_depth set, the parts that still need splitting after tile_depth cuts are not scanned here, but have
+    their (boxes, edges) looked up in tiles instead; any missing from tiles are added to it, covering nothing. So a
+    first call with an empty tiles dict lists the tiles, in order, and once those are scanned (which can be done
+    in parallel) a second call stitches them together exactly as one full scan would have.
+
+    Args:
+        image: A 2D uint8 array, where 255 is open space and 0 is blocked.
+        box: The (x1, x2, y1, y2) box to cover.
+        min_feature_size: The area below which parts are not split any further.
+        white: The summed-area table of image == 255, if already built.
+        black: The summed-area table of image == 0, if already built.
+        tile_depth: The number of cuts after which parts are looked up in tiles, if any.
+        tiles: A dictionary mapping tile boxes to their (boxes, edges).
+
+    Returns:
+        The boxes covering the box, and the edges joining boxes which touch.
+    """
+    if white is None:
+        white = summed_area_table(image == 255)
+    if black is None:
+        black = summed_area_table(image == 0)
+
+    done = []  # (boxes, edges) of the parts finished and not yet merged
+    stack = [(box, False, 0)]
+
+    while stack:
+        box, split, depth = stack.pop()
+
+        if split:
+            # both halves are done, the second on top
+            second = done.pop()
+            done.append(merge_halves(box, done.pop(), second))
+            continue
+
+        x1, x2, y1, y2 = box
+        area = (x2 - x1) * (y2 - y1)
+        all_white = box_sum(white, box) == area
+
+        if area < min_feature_size or all_white or box_sum(black, box) == area:
+
+            # this box is simple enough to handle in one node
+            done.append(([box], []) if all_white else ([], []))
+
+        else:
+
+            # split this big box on the longest dimension, handling the first half first
+            first_box, second_box = split_box(box)[:2]
+            if first_box == box:
+                # too thin for the cut to shrink it (only with a tiny min_feature_size), so it cannot be covered
+                done.append(([], []))
+                continue
+            if depth == tile_depth:
+                done.append(tiles.setdefault(box, ([], [])))
+                continue
+            stack.append((box, True, depth))
+            stack.append((second_box, False, depth + 1))
+            stack.append((first_box, False, depth + 1))
+
+    return done.pop()
+
+
+def scan_tile(block, box, min_feature_size):
+    """ Scans one tile of an image, given just its pixels (block), returning its boxes and edges in image coordinates.
+
+    Every cut is made at the same offset from the edge of the part being cut, so scanning the block on its own and
+    shifting the results gives the same boxes as scanning the tile in place.
+    """
+    boxes, edges = scan(block, (0, block.shape[0], 0, block.shape[1]), min_feature_size)
+
+    def shift(b): return (b[0] + box[0], b[1] + box[0], b[2] + box[2], b[3] + box[2])
+
+    return [shift(b) for b in boxes], [(shift(a), shift(b)) for a, b in edges]
+
+
+def build_mesh(image, min_feature_size, processes=1):
+    """ Builds a navmesh over the white (255) pixels of an image.
+
+    Args:
+        image: A 2D uint8 array, where 255 is open space and 0 is blocked.
+        min_feature_size: The area below which boxes are not split any further.
+        processes: The number of processes to scan tiles of the image in (None for one per core), or 1 to scan it
+            all in this process. The mesh is the same either way.
+
+    Returns:
+        The mesh (dict), holding its boxes, the boxes adjacent to each, and a spatial index over them.
+    """
+    root = (0, image.shape[0], 0, image.shape[1])
+
+    if processes == 1:
+        boxes, edges = scan(image, root, min_feature_size)
+    else:
+        # cut the image into about four tiles per process, scan them in a pool, then stitch them back together
+        white, black = summed_area_table(image == 255), summed_area_table(image == 0)
+        tile_depth = (4 * (processes or cpu_count()) - 1).bit_length()
+        tiles = {}
+        scan(image, root, min_feature_size, white, black, tile_depth, tiles)
+
+        with Pool(processes) as pool:
+            results = pool.starmap(scan_tile, [(image[x1:x2, y1:y2], (x1, x2, y1, y2), min_feature_size)
+                                               for x1, x2, y1, y2 in tiles])
+        tiles = dict(zip(tiles, results))
+        boxes, edges = scan(image, root, min_feature_size, white, black, tile_depth, tiles)
 
     adj = collections.defaultdict(list)
     for a, b in edges:
@@ -121,6 +264,9 @@ def build_mesh(image, min_feature_size):
         adj[b].append(a)
 
     mesh = {'boxes': list(adj.keys()), 'adj': dict(adj)}
+    # saved with the mesh, for find_path
+    mesh['index'] = build_index(mesh['boxes'])
+    mesh['portals'] = portal_table(mesh)
 
     return mesh
 
@@ -128,6 +274,7 @@ def build_mesh(image, min_feature_size):
 if __name__ == '__main__':
 
     min_feature_size = 16
+    processes = 1
     filename = None
 
     if len(sys.argv) == 2:
@@ -135,21 +282,26 @@ if __name__ == '__main__':
     elif len(sys.argv) == 3:
         filename = sys.argv[1]
         min_feature_size = int(sys.argv[2])
+    elif len(sys.argv) == 4:
+        filename = sys.argv[1]
+        min_feature_size = int(sys.argv[2])
+        processes = int(sys.argv[3]) or None
     else:
-        print("usage: %s map_filename min_feature_size" % sys.argv[0])
+        print("usage: %s map_filename min_feature_size [processes]" % sys.argv[0])
         sys.exit(-1)
 
     img = (imread(filename) * 255).astype(dtype=numpy.uint8)
     if len(img.shape) > 2:
         img = img[:, :, 0]
 
-    mesh = build_mesh(img, min_feature_size)
+    mesh = build_mesh(img, min_feature_size, processes)
 
     print(type(mesh))
     print(mesh.keys())
 
     with open(filename + '.mesh.pickle', 'wb') as f:
         pickle.dump(mesh, f, protocol=pickle.HIGHEST_PROTOCOL)
+    save_compact_mesh(mesh, filename + '.mesh.npy')
 
     atlas = zeros_like(img)
     for x1, x2, y1, y2 in mesh['boxes']:
@@ -1,6 +1,9 @@
-from heapq import heapify, heappush
+from collections import OrderedDict
+from heapq import heappop, heappush
 from math import inf
 
+from p2_mesh import is_compact, locate, mesh_centres, mesh_portals
+
 
 def find_path(source_point, destination_point, mesh):
     """
@@ -9,7 +12,7 @@ def find_path(source_point, destination_point, mesh):
     Args:
         source_point: starting point of the pathfinder
         destination_point: the ultimate goal the pathfinder must reach
-        mesh: pathway constraints the path adheres to
+        mesh: pathway constraints the path adheres to, as built by p2_meshbuilder or loaded by p2_mesh.load_mesh
 
     Returns:
 
@@ -17,63 +20,171 @@ def find_path(source_point, destination_point, mesh):
         A list of boxes explored by the algorithm
     """
 
-    def find_box(point):
-        return next((box for box in mesh["boxes"] if point[0] >= box[0] and point[0] < box[1] and point[1] >= box[2] and point[1] < box[3]), None)
-    start = find_box(source_point)
-    end = find_box(destination_point)
-    if not start or not end:
+    start, end = end_boxes(source_point, destination_point, mesh)
+    if start is None or end is None:
         print("No path!")
         return [], []
     if start == end:
-        return [(source_point, destination_point)], [start]
+        return [(source_point, destination_point)], [box_bounds(mesh, start)]
 
-    grid = {}
+    crossings, visited = box_route(start, end, mesh)
+    if crossings is None:
+        print("No path!")
+        return [], visited
+    return segments(source_point, destination_point, crossings), visited
 
-    def Node(bounds, h=0, g=inf, f=inf, prev=None, head=True):
-        grid[bounds] = {"h": h, "g": g, "f": f, "prev": prev, "head": head}
-        return bounds
 
-    def centre(b):
-        return ((b[0]+b[1])/2, (b[2]+b[3])/2)
+def end_boxes(source_point, destination_point, mesh):
+    """ Finds the boxes holding both ends of a path, as the box tuples of a pickled mesh or the box numbers of a
+    compact one (None for an end outside every box). """
+    start = locate(mesh, source_point)
+    end = locate(mesh, destination_point)
+    if not is_compact(mesh):
+        start = None if start is None else mesh["boxes"][start]
+        end = None if end is None else mesh["boxes"][end]
+    return start, end
 
-    def dist(a, b):
-        return (lambda c, d: ((d[0]-c[0])**2+(d[1]-c[1])**2)**.5)(centre(a), centre(b))
 
-    def tuplify(boxes):
-        def clamp(a, b):
-            def c(i):
-                return max(min(max(a[i], b[i]), centre(a)[i]), min(a[i+1], b[i+1]))
-            return (c(0), c(1))
-        centres = [destination_point] + (lambda B: [clamp(b, B[i+1])
-                                                    for i, b in enumerate(B[:-1])])(boxes[1:-1]) + [source_point]
-        return zip(centres[1:], centres[:-1])
+def box_bounds(mesh, box):
+    """ Gives the (x1, x2, y1, y2) bounds of a box as returned by end_boxes. """
+    if is_compact(mesh):
+        return tuple(int(v) for v in mesh['boxes'][box])
+    return box
+
+
+def segments(source_point, destination_point, crossings):
+    """ Joins the ends of a path and the portal points crossed between them (as box_route lists them) into segments,
+    running from the destination back. """
+    path_points = [destination_point] + crossings + [source_point]
+    return zip(path_points[1:], path_points[:-1])
+
+
+def box_route(start, end, mesh):
+    """
+    Searches for the cheapest route of boxes between two boxes of the mesh with A*
+
+    Args:
+        start: the box the route starts from, as returned by end_boxes
+        end: the box the route ends in, as returned by end_boxes
+        mesh: pathway constraints the path adheres to
+
+    Returns:
+
+        The portal points a path along the route crosses, from the end back (leaving out the portals into the start
+        and end boxes themselves), or None if there is no route
+        A list of boxes explored by the algorithm
+    """
+
+    portals = mesh_portals(mesh)
+
+    if is_compact(mesh):
+        # boxes are numbered, with their bounds and edges read out of the mesh's arrays (through memoryviews, which
+        # index far faster than numpy)
+        boxes, offsets, targets = (memoryview(mesh[key]).cast('B').cast('i') for key in ('boxes', 'offsets', 'targets'))
+        costs, points = (memoryview(portals[key]).cast('B').cast('d') for key in ('costs', 'points'))
+
+        def bounds(n):
+            return tuple(boxes[4*n:4*n+4].tolist())
+
+        def edges(n):
+            return [(targets[k], costs[k], (points[2*k], points[2*k+1]), k) for k in range(offsets[n], offsets[n+1])]
+    else:
+        def bounds(box):
+            return box
+
+        edges = portals.__getitem__
+
+    centres = mesh_centres(mesh)
+
+    def dist(a, b):
+        (x1, y1), (x2, y2) = centres[a], centres[b]
+        return ((x2-x1)**2+(y2-y1)**2)**.5
 
-    Node(start, g=0)
-    Node(end, head=False)
+    def visited():
+        return g.keys() if not is_compact(mesh) else [bounds(n) for n in g]
 
-    open_set = [start]
-    path = []
+    # cost so far, previous box and the portal point crossed into every box reached, closed boxes, and the queue of
+    # (f, g, box) with stale entries
+    g = {start: 0, end: inf}
+    prev = {start: None}
+    crossing = {}
+    closed = set()
+    open_set = [(dist(start, end), 0, start)]
 
     while open_set:
-        # get node with min f
-        current = min(open_set, key=lambda n: grid[n]["f"])
-        if(current == end):  # if at goal
+        _, current_g, current = heappop(open_set)
+        if current in closed:  # skip stale queue entries
+            continue
+        if current == end:  # if at goal
+            path = []
             back = current
-            while back:
+            while back is not None:
                 path.append(back)
-                back = grid[back]["prev"]
-            return tuplify(path), grid.keys()
-
-        open_set.remove(current)
-        heapify(open_set)
-        for neighbour in mesh["adj"][current]:  # check each neighbour
-            temp_g = grid[current]["g"] + dist(current, neighbour)
-            # check predicted dist
-            if neighbour not in grid.keys() or temp_g < grid[neighbour]["g"]:
-                Node(neighbour, g=temp_g, f=temp_g +
-                     dist(neighbour, end if grid[current]["head"] else start), prev=current, head=grid[current]["head"])
-                if neighbour not in open_set:
-                    heappush(open_set, neighbour)
-    print("No path!")
-
-    return [], grid.keys()
+                back = prev[back]
+            return [crossing[n] for n in path[1:-2]], visited()
+
+        closed.add(current)
+        for neighbour, cost, point, _ in edges(current):  # check each neighbour
+            if neighbour in closed:
+                continue
+            temp_g = current_g + cost
+            if temp_g < g.get(neighbour, inf):
+                g[neighbour] = temp_g
+                prev[neighbour] = current
+                crossing[neighbour] = point
+                heappush(open_set, (temp_g + dist(neighbour, end), temp_g, neighbour))
+
+    return None, visited()
+
+
+class RouteCache:
+    def __init__(self, capacity=1024):
+        """ Initializes a cache of box routes in front of find_path, keyed by the boxes holding each end of a path.
+
+        Only the route through the boxes is kept, so paths between any points of the same two boxes reuse it. The
+        least recently used routes are dropped once there are more than capacity, and all of them are dropped when
+        the cache is asked about a different mesh object than before.
+
+        Args:
+            capacity:   The most routes kept at once.
+
+        """
+        self.capacity = capacity
+        self.routes = OrderedDict()     # (start box, end box) -> portal points crossed, or None if no route
+        self.mesh = None                # the mesh the routes were found in
+        self.hits = 0
+        self.misses = 0
+
+    def find_path(self, source_point, destination_point, mesh):
+        """ Finds a path like find_path, reusing the route between the same two boxes if it is cached.
+
+        Returns:    The same as find_path, except that no boxes are explored when the route is cached.
+        """
+        if mesh is not self.mesh:
+            self.clear()
+            self.mesh = mesh
+
+        start, end = end_boxes(source_point, destination_point, mesh)
+        if start is None or end is None or start == end:
+            return find_path(source_point, destination_point, mesh)
+
+        key = (start, end)
+        if key in self.routes:
+            self.hits += 1
+            self.routes.move_to_end(key)
+            crossings, visited = self.routes[key], []
+        else:
+            self.misses += 1
+            crossings, visited = box_route(start, end, mesh)
+            self.routes[key] = crossings
+            if len(self.routes) > self.capacity:
+                self.routes.popitem(last=False)
+
+        if crossings is None:
+            print("No path!")
+            return [], visited
+        return segments(source_point, destination_point, crossings), visited
+
+    def clear(self):
+        """ Throws away every cached route, for changes made to the mesh object in place. """
+        self.routes.clear()